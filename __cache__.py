@@ -0,0 +1,196 @@
+import collections
+import threading
+import pathlib
+import typing
+import uuid
+import diskcache
+import pandas
+from __global__ import *
+
+_ELEMENT_CHUNK_SIZE = 256
+
+
+def _open_cache() -> diskcache.Cache:
+    cache_settings = load_settings().get('cache', {})
+    cache_directory = pathlib.Path(__file__).parent / cache_settings.get('directory', 'cache')
+    return diskcache.Cache(
+        str(cache_directory),
+        size_limit=cache_settings.get('size-limit', 2 ** 30),
+        eviction_policy=cache_settings.get('eviction-policy', 'least-recently-used'),
+    )
+
+# Our cache lives on disk, so it is shared between our Dash workers and their background callbacks.
+cache = _open_cache()
+
+
+def put_result(results: typing.List, graph_data: typing.Dict) -> str:
+    """ Store the results of a query server-side, returning the handle that our dcc.Stores hold instead. """
+    handle = uuid.uuid4().hex
+    expire = load_settings().get('results', {}).get('expire')
+    with cache.transact():
+        cache.set(('results', handle), results, expire=expire, tag='results')
+        put_graph(handle, graph_data)
+    return handle
+
+def put_graph(handle: str, graph_data: typing.Dict):
+    expire = load_settings().get('results', {}).get('expire')
+    with cache.transact():
+        cache.set(('graph', handle), graph_data, expire=expire, tag='results')
+
+        # The documents behind our nodes and edges are also stored in chunks, so that they can be fetched one at a time.
+        for kind in ('nodes', 'edges'):
+            chunks = collections.defaultdict(dict)
+            for element in graph_data[kind]:
+                chunks[(element['id'] - 1) // _ELEMENT_CHUNK_SIZE][element['id']] = element.get('data')
+            for chunk_id, chunk in chunks.items():
+                cache.set(('elements', handle, kind, chunk_id), chunk, expire=expire, tag='results')
+
+def put_expanded_graph(handle: str, graph_data: typing.Dict) -> str:
+    """ Store a graph grown from the one behind a handle under a new handle, leaving our original graph untouched. """
+    expanded_handle = uuid.uuid4().hex
+    with cache.transact():
+        put_graph(expanded_handle, graph_data)
+        put_graph_names(expanded_handle, get_graph_names(handle))
+        put_aggregating(expanded_handle, is_aggregating(handle))
+    return expanded_handle
+
+def put_graph_names(handle: str, graph_names: typing.List[typing.Tuple[str, str]]):
+    expire = load_settings().get('results', {}).get('expire')
+    cache.set(('graph-names', handle), graph_names, expire=expire, tag='results')
+
+def get_graph_names(handle: typing.Optional[str]) -> typing.List[typing.Tuple[str, str]]:
+    if handle is None:
+        return []
+    return cache.get(('graph-names', handle), default=[])
+
+def put_aggregating(handle: str, is_aggregating: bool):
+    # Our graph can only be grown the way it was built, whatever our edge aggregation setting is now.
+    expire = load_settings().get('results', {}).get('expire')
+    cache.set(('aggregating', handle), bool(is_aggregating), expire=expire, tag='results')
+
+def is_aggregating(handle: typing.Optional[str]) -> bool:
+    if handle is None:
+        return False
+    return cache.get(('aggregating', handle), default=False)
+
+def get_results(handle: typing.Optional[str]) -> typing.List:
+    if handle is None:
+        return []
+    return cache.get(('results', handle), default=[])
+
+def get_graph(handle: typing.Optional[str]) -> typing.Dict:
+    if handle is None:
+        return {'nodes': [], 'edges': []}
+    return cache.get(('graph', handle), default={'nodes': [], 'edges': []})
+
+def get_element(handle: typing.Optional[str], kind: str, element_id: int) -> typing.Any:
+    if handle is None:
+        return None
+    chunk = cache.get(('elements', handle, kind, (element_id - 1) // _ELEMENT_CHUNK_SIZE), default={})
+    return chunk.get(element_id)
+
+class _FrameCache:
+    """ A bounded, in-process LRU of flattened result frames, so that paging and tab switches skip the disk. """
+
+    def __init__(self, max_count: int, max_bytes: int):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self._frames = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, handle: str) -> typing.Optional[pandas.DataFrame]:
+        with self._lock:
+            if handle not in self._frames:
+                return None
+            self._frames.move_to_end(handle)
+            return self._frames[handle][0]
+
+    def put(self, handle: str, frame: pandas.DataFrame):
+        frame_bytes = int(frame.memory_usage(index=True, deep=True).sum())
+        if frame_bytes > self.max_bytes:
+            return
+        with self._lock:
+            self._frames[handle] = (frame, frame_bytes)
+            self._frames.move_to_end(handle)
+            while len(self._frames) > self.max_count or \
+                    sum(b for _, b in self._frames.values()) > self.max_bytes:
+                self._frames.popitem(last=False)
+
+_frame_cache = _FrameCache(
+    max_count=load_settings().get('results', {}).get('frame-cache-count', 8),
+    max_bytes=load_settings().get('results', {}).get('frame-cache-bytes', 2 ** 28),
+)
+
+
+def get_metadata(key: typing.Tuple) -> typing.Optional[typing.List]:
+    return cache.get(('metadata',) + key)
+
+def put_metadata(key: typing.Tuple, results: typing.List):
+    expire = load_settings().get('metadata', {}).get('expire')
+    cache.set(('metadata',) + key, results, expire=expire, tag='metadata')
+
+def invalidate_metadata():
+    cache.evict('metadata')
+    cache.incr(('metadata-generation',), default=0)
+
+def get_metadata_generation() -> int:
+    # Anything built from our metadata (e.g. our metadata page) can be reused until this changes.
+    return cache.get(('metadata-generation',), default=0)
+
+def get_query(key: typing.Tuple) -> typing.Optional[str]:
+    handle = cache.get(('query',) + key)
+    if handle is None or ('results', handle) not in cache:
+        return None
+    return handle
+
+def put_query(key: typing.Tuple, handle: str):
+    expire = load_settings().get('query-cache', {}).get('expire')
+    cache.set(('query',) + key, handle, expire=expire, tag='query')
+
+def invalidate_queries():
+    cache.evict('query')
+
+def put_request(client_context_id: str):
+    # Running statements are recorded in our cache, as they are issued and cancelled from different processes.
+    expire = load_settings()['query'].get('timeout')
+    cache.set(('request', client_context_id), True, expire=expire, tag='request')
+
+def remove_request(client_context_id: str) -> bool:
+    return cache.delete(('request', client_context_id))
+
+def is_request_running(client_context_id: typing.Optional[str]) -> bool:
+    return client_context_id is not None and ('request', client_context_id) in cache
+
+def get_layout(handle: typing.Optional[str], view: typing.Tuple) -> typing.Optional[typing.Dict]:
+    if handle is None:
+        return None
+    return cache.get(('layout', handle, view))
+
+def put_layout(handle: str, view: typing.Tuple, layout: typing.Dict):
+    # Our layouts are kept for as long as the results they were computed for.
+    expire = load_settings().get('results', {}).get('expire')
+    cache.set(('layout', handle, view), layout, expire=expire, tag='results')
+
+def put_batch(client_context_id: str, index: int, batch: typing.Dict):
+    # The partial graphs of a streaming query are only needed until the query completes.
+    expire = load_settings()['query'].get('timeout')
+    cache.set(('batch', client_context_id, index), batch, expire=expire, tag='results')
+
+def get_batches(client_context_id: str, start: int, stop: int) -> typing.List[typing.Dict]:
+    batches = (cache.get(('batch', client_context_id, i)) for i in range(start, stop))
+    return [b for b in batches if b is not None]
+
+def get_frame(handle: typing.Optional[str]) -> typing.Optional[pandas.DataFrame]:
+    if handle is None:
+        return None
+    frame = _frame_cache.get(handle)
+    if frame is None:
+        frame = cache.get(('frame', handle))
+        if frame is not None:
+            _frame_cache.put(handle, frame)
+    return frame
+
+def put_frame(handle: str, frame: pandas.DataFrame):
+    expire = load_settings().get('results', {}).get('expire')
+    cache.set(('frame', handle), frame, expire=expire, tag='results')
+    _frame_cache.put(handle, frame)
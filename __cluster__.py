@@ -0,0 +1,70 @@
+import threading
+import requests
+import requests.adapters
+import urllib3.util
+import os
+from __global__ import *
+
+_ADD_CONTEXT = 'SET `graphix.compiler.add-context` "true"; '
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session, _session_pid
+    with _session_lock:
+        # Pooled connections cannot be shared with a forked process (e.g. our background callbacks).
+        if _session is not None and _session_pid == os.getpid():
+            return _session
+
+        cluster_settings = load_settings()['cluster']
+        retry = urllib3.util.Retry(
+            total=cluster_settings.get('retries', 3),
+            connect=cluster_settings.get('retries', 3),
+            status=cluster_settings.get('retries', 3),
+            read=0,  # A statement whose response was lost may have already run, so we do not resend it.
+            status_forcelist=(502, 503),
+            allowed_methods=None,
+            backoff_factor=cluster_settings.get('backoff-factor', 0.5),
+            raise_on_status=False,
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=cluster_settings.get('pool-size', 8),
+            pool_block=True,
+            max_retries=retry,
+        )
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+        _session_pid = os.getpid()
+        return _session
+
+def get_cluster_uri(path: str) -> str:
+    cluster_settings = load_settings()['cluster']
+    return f"http://{cluster_settings['address']}:{cluster_settings['port']}{path}"
+
+def post_statement(statement: str, stream: bool = False, **parameters) -> requests.Response:
+    """ Issue a statement to the query service through our pooled session, with add-context enabled. """
+    settings_json = load_settings()
+    timeout = (settings_json['cluster'].get('connect-timeout', 10), settings_json['query'].get('timeout'))
+    return _get_session().post(
+        get_cluster_uri('/query/service'),
+        data={'statement': _ADD_CONTEXT + statement, **parameters},
+        timeout=timeout,
+        stream=stream,
+    )
+
+def cancel_statement(client_context_id: str) -> bool:
+    """ Cancel a running statement by the client_context_id it was issued with. """
+    connect_timeout = load_settings()['cluster'].get('connect-timeout', 10)
+    response = _get_session().delete(
+        get_cluster_uri('/admin/requests/running'),
+        params={'client_context_id': client_context_id},
+        timeout=(connect_timeout, connect_timeout),
+    )
+
+    # Our statement may have finished (or never started) by the time we get to it.
+    return response.status_code == 200
@@ -1,3 +1,7 @@
 class GraphixStatementError(RuntimeError):
     def __init__(self, response_json):
         super().__init__('\n'.join(e['msg'] for e in response_json['errors']))
+
+class GraphixJobQueueFullError(RuntimeError):
+    def __init__(self, queue_length):
+        super().__init__(f'{queue_length} queries are already waiting to run, please try again later.')
@@ -1,18 +1,30 @@
+import pathlib
+import json
 import dash
 import dash_bootstrap_components as bootstrap
 
+QUERY_DIRECTORY = '/'
+METADATA_DIRECTORY = '/metadata/'
+FUNCTIONS_DIRECTORY = '/builtin-functions/'
+SETTINGS_DIRECTORY = '/settings/'
+SETTINGS_FILE = pathlib.Path(__file__).parent / 'settings/graphix.json'
+
+
+def load_settings():
+    if not SETTINGS_FILE.exists():
+        raise FileNotFoundError(SETTINGS_FILE.name)
+    with SETTINGS_FILE.open('r') as fp:
+        return json.load(fp)
+
+
 app = dash.Dash(
     __name__,
     title='Graphix Query Console',
     suppress_callback_exceptions=True,
+    compress=load_settings().get('server', {}).get('compress', False),
     external_stylesheets=[
         bootstrap.themes.SPACELAB,
         "https://cdn.jsdelivr.net/gh/AnnMarieW/dash-bootstrap-templates/dbc.min.css",
         'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.9.1/font/bootstrap-icons.css'
     ]
 )
-
-QUERY_DIRECTORY = '/'
-METADATA_DIRECTORY = '/metadata/'
-FUNCTIONS_DIRECTORY = '/builtin-functions/'
-SETTINGS_DIRECTORY = '/settings/'
@@ -0,0 +1,371 @@
+import collections
+import hashlib
+import itertools
+import math
+import typing
+import json
+import numpy
+
+
+def get_vertex_keys(graphs: typing.List[typing.Dict]) -> typing.Dict[str, typing.List[typing.List[str]]]:
+    """ Map each vertex label to the primary key fields given by the Metadata Graph definitions. """
+    vertex_keys, conflicting_labels = {}, set()
+    for graph in graphs:
+        for vertex in graph.get('Vertices', []):
+            if not vertex.get('PrimaryKey'):
+                continue
+            primary_key = [[k] if isinstance(k, str) else list(k) for k in vertex['PrimaryKey']]
+            if vertex_keys.setdefault(vertex['Label'], primary_key) != primary_key:
+                conflicting_labels.add(vertex['Label'])
+
+    # A label that is keyed differently in different graphs cannot be used to identify a vertex.
+    return {k: v for k, v in vertex_keys.items() if k not in conflicting_labels}
+
+def get_neighbor_statements(graphs: typing.List[typing.Dict], graph_names: typing.List[typing.Tuple[str, str]],
+                            vertex_keys: typing.Dict, label: str, node: typing.Any, row_limit: int) -> typing.List[str]:
+    """
+    Build one query per edge definition (of the graphs named by graph_names) that touches our vertex label, each
+    matching the vertices adjacent to our vertex (identified by its primary key) through that edge.
+    """
+    if label not in vertex_keys or not isinstance(node, dict):
+        return []
+    predicates = []
+    for field_path in vertex_keys[label]:
+        value = node
+        for field_name in field_path:
+            value = value.get(field_name) if isinstance(value, dict) else None
+        if value is None or isinstance(value, (dict, list)):
+            return []
+        predicates.append(f"n.{'.'.join(f'`{f}`' for f in field_path)} = {json.dumps(value)}")
+
+    statements = []
+    for graph in graphs:
+        if (graph['DataverseName'], graph['GraphName']) not in graph_names or \
+                not any(v['Label'] == label for v in graph.get('Vertices', [])):
+            continue
+        graph_name = f"`{graph['DataverseName']}`.`{graph['GraphName']}`"
+        for edge in graph.get('Edges', []):
+            patterns = []
+            if edge['SourceLabel'] == label:
+                patterns.append(f"(n:`{label}`)-[e:`{edge['Label']}`]->(m:`{edge['DestinationLabel']}`)")
+            if edge['DestinationLabel'] == label:
+                patterns.append(f"(m:`{edge['SourceLabel']}`)-[e:`{edge['Label']}`]->(n:`{label}`)")
+            statements.extend(
+                f"FROM GRAPH {graph_name}\n\t{pattern}\nWHERE {' AND '.join(predicates)}\n"
+                f"SELECT n, e, m\nLIMIT {row_limit};"
+                for pattern in patterns
+            )
+    return statements
+
+def get_pattern_variables(patterns: typing.Dict) -> typing.Tuple[typing.Dict, typing.Dict]:
+    # Store variable names representing nodes and edges.
+    node_variables = {
+        node["graphElement"]["variable"]: node["graphElement"]["labels"][0]
+        for node in patterns["vertices"]
+    }
+    edge_variables = {
+        edge["graphElement"]["variable"]: {
+            "label": edge["graphElement"]["labels"][0],
+            "from": edge["edgeElement"]["leftVertex"]["variable"],
+            "to": edge["edgeElement"]["rightVertex"]["variable"]
+        }
+        for edge in patterns["edges"]
+    }
+    if not edge_variables:
+        edge_variables = {
+            edge["graphElement"]["variable"]: {
+                "label": edge["graphElement"]["labels"][0],
+                "from": edge["edgeElement"]["leftVertex"]["variable"],
+                "to": edge["edgeElement"]["rightVertex"]["variable"]
+            }
+            for edge in patterns["paths"]
+        }
+    return node_variables, edge_variables
+
+def get_canonical_key(document: typing.Any) -> bytes:
+    canonical_json = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(canonical_json.encode('utf-8'), digest_size=16).digest()
+
+def get_node_key(vertex_keys: typing.Dict, label: str, node: typing.Any) -> typing.Hashable:
+    # Vertices are identified by their primary key if we know it, and by a hash of their document otherwise.
+    if label in vertex_keys and isinstance(node, dict):
+        key_values = []
+        for field_path in vertex_keys[label]:
+            value = node
+            for field_name in field_path:
+                value = value.get(field_name) if isinstance(value, dict) else None
+            if value is None or isinstance(value, (dict, list)):
+                break
+            key_values.append(value)
+        else:
+            return label, tuple(key_values)
+    return get_canonical_key(node)
+
+
+class GraphBuilder:
+    """ Turns query result entries into vis.js nodes and edges, one entry at a time. """
+
+    def __init__(self, patterns: typing.Dict, node_limit: int, vertex_keys: typing.Dict = None,
+                 is_aggregating: bool = False):
+        self.node_limit = node_limit
+        self.vertex_keys = vertex_keys or {}
+        self.is_aggregating = is_aggregating
+        self.nodes = {}
+        self.edges = {}
+        self._edge_keys = set()
+
+        self.node_variables, self.edge_variables = get_pattern_variables(patterns)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.nodes) >= self.node_limit
+
+    def add_entry(self, entry: typing.Dict):
+        # Go through each node, cache each node's id.
+        id_dict = {}
+        for variable, node in entry.items():
+            if self.is_full:
+                break
+            if variable[0] == '$':
+                variable = '#' + variable[1:]
+            if variable in self.node_variables:
+                node_key = get_node_key(self.vertex_keys, self.node_variables[variable], node)
+                if node_key in self.nodes:
+                    id_dict[variable] = self.nodes[node_key]["id"]
+                else:
+                    idx = len(self.nodes) + 1
+                    id_dict[variable] = idx
+                    label = node['name'] if 'name' in node else f"{self.node_variables[variable]}-{idx}"
+                    self.nodes[node_key] = {
+                        "id": idx,
+                        "data": node,
+                        "label": "\n".join(label.split()),
+                        "group": self.node_variables[variable],
+                    }
+
+        # Go through each edge.
+        for variable, edge in entry.items():
+            if variable[0] == '$':
+                variable = '#' + variable[1:]
+            if variable in self.edge_variables:
+                edge_definition = self.edge_variables[variable]
+                label = edge_definition["label"]
+                if edge_definition["from"] not in id_dict or edge_definition["to"] not in id_dict:
+                    continue
+
+                # The same edge may be bound by many of our results, but we only want to draw it once.
+                edge_key = (id_dict[edge_definition["from"]], id_dict[edge_definition["to"]], label,
+                            get_canonical_key(edge))
+                if edge_key in self._edge_keys:
+                    continue
+                self._edge_keys.add(edge_key)
+
+                # When aggregating, parallel edges of the same label are collapsed into one weighted edge.
+                if self.is_aggregating and edge_key[:3] in self.edges:
+                    aggregate = self.edges[edge_key[:3]]
+                    aggregate["data"].append(edge)
+                    aggregate["value"] += 1
+                    aggregate["label"] = f"{label} ({aggregate['value']})"
+                elif self.is_aggregating:
+                    self.edges[edge_key[:3]] = {
+                        "id": len(self.edges) + 1,
+                        "from": edge_key[0],
+                        "to": edge_key[1],
+                        "data": [edge],
+                        "label": label,
+                        "value": 1,
+                    }
+                else:
+                    self.edges[edge_key] = {
+                        "id": len(self.edges) + 1,
+                        "from": edge_key[0],
+                        "to": edge_key[1],
+                        "data": edge,
+                        "label": label,
+                    }
+
+    def add_graph(self, graph_data: typing.Dict):
+        """ Start from the nodes and edges of a graph we have already built, so that new entries are merged into it. """
+        for node in graph_data['nodes']:
+            self.nodes[get_node_key(self.vertex_keys, node['group'], node['data'])] = node
+        for edge in graph_data['edges']:
+            if self.is_aggregating:
+                label = edge['label'].rsplit(' (', 1)[0] if edge['value'] > 1 else edge['label']
+                self._edge_keys.update((edge['from'], edge['to'], label, get_canonical_key(d)) for d in edge['data'])
+                self.edges[(edge['from'], edge['to'], label)] = edge
+            else:
+                edge_key = (edge['from'], edge['to'], edge['label'], get_canonical_key(edge['data']))
+                self._edge_keys.add(edge_key)
+                self.edges[edge_key] = edge
+
+    def to_dict(self) -> typing.Dict:
+        return {'nodes': list(self.nodes.values()), 'edges': list(self.edges.values())}
+
+
+def get_communities(graph_data: typing.Dict, max_iterations: int = 10) -> typing.Dict[int, int]:
+    """ Detect communities by label propagation, returning a community id for each node id. """
+    neighbors = {n['id']: [] for n in graph_data['nodes']}
+    for edge in graph_data['edges']:
+        if edge['from'] in neighbors and edge['to'] in neighbors and edge['from'] != edge['to']:
+            neighbors[edge['from']].append(edge['to'])
+            neighbors[edge['to']].append(edge['from'])
+
+    # Each node starts in its own community and repeatedly joins the one most common among its neighbors.
+    communities = {node_id: node_id for node_id in neighbors}
+    for _ in range(max_iterations):
+        is_changed = False
+        for node_id, node_neighbors in neighbors.items():
+            if not node_neighbors:
+                continue
+            counts = collections.Counter(communities[n] for n in node_neighbors)
+            best_count = max(counts.values())
+            community = min(c for c, count in counts.items() if count == best_count)
+            if community != communities[node_id]:
+                communities[node_id], is_changed = community, True
+        if not is_changed:
+            break
+    return communities
+
+def _split_cluster(cluster_id: str, label: str, members: typing.List[typing.Dict], max_group_size: int,
+                   communities: typing.Dict[int, int]) -> typing.List[typing.Tuple[str, str, typing.List[typing.Dict]]]:
+    # A cluster is split into its communities (with every vertex that is alone in its community collected together),
+    # unless there are too many of these. Otherwise, it is split into at most max_group_size ranges of its vertices.
+    segments, singletons = [], []
+    for community, community_members in itertools.groupby(members, key=lambda n: communities[n['id']]):
+        community_members = list(community_members)
+        if len(community_members) > 1:
+            segments.append((f'{cluster_id}/community:{community}', f'{label} community {community}',
+                             community_members))
+        else:
+            singletons.extend(community_members)
+    if singletons:
+        segments.append((f'{cluster_id}/others', f'{label} others', singletons))
+    if 1 < len(segments) <= max_group_size:
+        return segments
+
+    range_count = max(2, min(max_group_size, math.ceil(len(members) / max_group_size)))
+    range_size = math.ceil(len(members) / range_count)
+    return [
+        (f'{cluster_id}/{i}', f'{label}, part {i + 1}', members[start:start + range_size])
+        for i, start in enumerate(range(0, len(members), range_size))
+    ]
+
+def _collapse_cluster(cluster_id: str, label: str, members: typing.List[typing.Dict], expanded: typing.Set[str],
+                      max_group_size: int, communities: typing.Dict[int, int], visible_ids: typing.Dict,
+                      clusters: typing.Dict):
+    group = members[0]['group']
+    if cluster_id not in expanded:
+        for node in members:
+            visible_ids[node['id']] = cluster_id
+        clusters[cluster_id] = {
+            "id": cluster_id,
+            "label": f"{label} ({len(members)})",
+            "title": f"{len(members)} {group} vertices, select to expand.",
+            "group": group,
+            "value": len(members),
+            "shape": "dot",
+        }
+    elif len(members) <= max_group_size:
+        for node in members:
+            visible_ids[node['id']] = node['id']
+    else:
+        for child_id, child_label, child_members in _split_cluster(cluster_id, label, members, max_group_size,
+                                                                   communities):
+            if len(child_members) == 1:
+                visible_ids[child_members[0]['id']] = child_members[0]['id']
+            else:
+                _collapse_cluster(child_id, child_label, child_members, expanded, max_group_size, communities,
+                                  visible_ids, clusters)
+
+def cluster_graph(graph_data: typing.Dict, expanded: typing.Iterable[str], max_group_size: int,
+                  communities: typing.Dict[int, int] = None) -> typing.Dict:
+    """
+    Collapse our graph into super-nodes, so that each expansion draws a bounded number of elements. Each group (i.e.
+    label) is a super-node until it is expanded. An expanded super-node shows its vertices if it has at most
+    max_group_size of them, and is otherwise split into at most max_group_size smaller super-nodes: its communities,
+    or ranges of its vertices.
+    """
+    expanded = set(expanded)
+    max_group_size = max(max_group_size, 2)
+    communities = communities if communities is not None else get_communities(graph_data)
+    groups = collections.defaultdict(list)
+    for node in sorted(graph_data['nodes'], key=lambda n: (communities[n['id']], n['id'])):
+        groups[node['group']].append(node)
+
+    # Each of our vertices is drawn as itself or as the super-node it has been collapsed into.
+    visible_ids, clusters = {}, {}
+    for group, members in groups.items():
+        _collapse_cluster(f'group:{group}', group, members, expanded, max_group_size, communities, visible_ids,
+                          clusters)
+    nodes = list(clusters.values()) + [n for n in graph_data['nodes'] if visible_ids[n['id']] == n['id']]
+
+    # Edges between two drawn vertices are kept as they are, edges that touch a super-node are merged per label.
+    edges, cluster_edges = [], {}
+    for edge in graph_data['edges']:
+        edge_from, edge_to = visible_ids.get(edge['from']), visible_ids.get(edge['to'])
+        if edge_from is None or edge_to is None:
+            continue
+        if edge_from == edge['from'] and edge_to == edge['to']:
+            edges.append(edge)
+            continue
+        if edge_from == edge_to:
+            continue
+        label = edge['label'].rsplit(' (', 1)[0] if 'value' in edge else edge['label']
+        cluster_edge = cluster_edges.setdefault((edge_from, edge_to, label), {
+            "id": f"{edge_from}->{edge_to}:{label}",
+            "from": edge_from,
+            "to": edge_to,
+            "label": label,
+            "value": 0,
+        })
+        cluster_edge["value"] += edge.get('value', 1)
+    for cluster_edge in cluster_edges.values():
+        cluster_edge["title"] = f"{cluster_edge['value']} {cluster_edge['label']} edges."
+        cluster_edge["label"] = f"{cluster_edge['label']} ({cluster_edge['value']})"
+    return {'nodes': nodes, 'edges': edges + list(cluster_edges.values())}
+
+def compute_layout(graph_data: typing.Dict, iterations: int = 50, scale: float = 100.0) -> typing.Dict:
+    """
+    Place our nodes with a Fruchterman-Reingold layout, returning an (x, y) position for each node id. Repulsion is
+    computed between all pairs of nodes, a block of rows at a time (as matrix products) to bound our memory.
+    """
+    node_ids = [n['id'] for n in graph_data['nodes']]
+    if not node_ids:
+        return {}
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edge_pairs = numpy.array([
+        (node_index[e['from']], node_index[e['to']]) for e in graph_data['edges']
+        if e['from'] in node_index and e['to'] in node_index and e['from'] != e['to']
+    ], dtype=numpy.int64).reshape(-1, 2)
+
+    # Our layout starts from the same (pseudo-random) positions for the same graph.
+    node_count = len(node_ids)
+    positions = numpy.random.default_rng(node_count).random((node_count, 2))
+    optimal_distance = 1 / numpy.sqrt(node_count)
+    block_size = max(1, 2 ** 22 // node_count)
+    temperature = 0.1
+    for _ in range(iterations):
+        # The repulsion on node i is the sum over j of (p_i - p_j) * k^2 / |p_i - p_j|^2.
+        displacement = numpy.empty_like(positions)
+        squared_norms = (positions ** 2).sum(axis=1)
+        for start in range(0, node_count, block_size):
+            block = positions[start:start + block_size]
+            distance_squared = squared_norms[start:start + block_size, None] + squared_norms[None, :] - \
+                2 * (block @ positions.T)
+            repulsion = optimal_distance ** 2 / numpy.maximum(distance_squared, 1e-6)
+            repulsion[numpy.arange(len(block)), numpy.arange(start, start + len(block))] = 0
+            displacement[start:start + block_size] = block * repulsion.sum(axis=1)[:, None] - repulsion @ positions
+        if len(edge_pairs):
+            delta = positions[edge_pairs[:, 0]] - positions[edge_pairs[:, 1]]
+            attraction = delta * (numpy.linalg.norm(delta, axis=1) / optimal_distance)[:, None]
+            numpy.add.at(displacement, edge_pairs[:, 0], -attraction)
+            numpy.add.at(displacement, edge_pairs[:, 1], attraction)
+
+        # Each node moves along its displacement, by no more than our (cooling) temperature.
+        length = numpy.maximum(numpy.linalg.norm(displacement, axis=1), 1e-9)
+        positions += displacement * (numpy.minimum(length, temperature) / length)[:, None]
+        temperature -= 0.1 / (iterations + 1)
+
+    # Our positions are centered and spread out in proportion to the number of nodes we have.
+    positions = (positions - positions.mean(axis=0)) * scale * numpy.sqrt(node_count)
+    return {node_id: (float(x), float(y)) for node_id, (x, y) in zip(node_ids, positions)}
@@ -0,0 +1,60 @@
+import pathlib
+import typing
+import diskcache
+import dash
+from __global__ import *
+from __errors__ import *
+
+
+class _BoundedCeleryManager(dash.CeleryManager):
+    """ A Celery manager that refuses new jobs once too many are waiting for a worker. """
+
+    def __init__(self, celery_app, queue_limit: int, expire: typing.Optional[int] = None):
+        super().__init__(celery_app, expire=expire)
+        self.queue_limit = queue_limit
+
+    def call_job_fn(self, key, job_fn, args, context):
+        with self.handle.connection_for_read() as connection:
+            queue_length = connection.default_channel.client.llen(self.handle.conf.task_default_queue)
+        if queue_length >= self.queue_limit:
+            raise GraphixJobQueueFullError(queue_length)
+        return super().call_job_fn(key, job_fn, args, context)
+
+def _open_celery_app(jobs_settings: typing.Dict):
+    import celery
+
+    celery_app = celery.Celery(
+        __name__,
+        broker=jobs_settings.get('broker', 'redis://localhost:6379/0'),
+        backend=jobs_settings.get('broker', 'redis://localhost:6379/0'),
+    )
+    celery_app.conf.update(
+        worker_concurrency=jobs_settings.get('concurrency', 4),
+        worker_prefetch_multiplier=1,  # A long query should not hold up the jobs queued behind it on one worker.
+        result_expires=jobs_settings.get('expire'),
+    )
+    return celery_app
+
+def _open_manager() -> typing.Tuple[dash.long_callback.managers.BaseLongCallbackManager, typing.Any]:
+    jobs_settings = load_settings().get('jobs', {})
+    if jobs_settings.get('backend', 'diskcache') == 'celery':
+        celery_app = _open_celery_app(jobs_settings)
+        manager = _BoundedCeleryManager(
+            celery_app,
+            queue_limit=jobs_settings.get('queue-limit', 32),
+            expire=jobs_settings.get('expire'),
+        )
+        return manager, celery_app
+
+    # Our job cache lives at a fixed location, so that every worker process (and a restarted one) shares it.
+    jobs_directory = pathlib.Path(__file__).parent / jobs_settings.get('directory', 'cache/jobs')
+    jobs_cache = diskcache.Cache(
+        str(jobs_directory),
+        size_limit=jobs_settings.get('size-limit', 2 ** 28),
+        eviction_policy=jobs_settings.get('eviction-policy', 'least-recently-used'),
+    )
+    return dash.DiskcacheManager(jobs_cache, expire=jobs_settings.get('expire')), None
+
+# Our background callbacks are run by this manager. Celery workers are started against our app (which registers our
+# callbacks as tasks), i.e. `celery -A app.celery_app worker`.
+manager, celery_app = _open_manager()
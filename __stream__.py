@@ -0,0 +1,98 @@
+import codecs
+import typing
+import json
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def _skip_whitespace(buffer: str, position: int) -> int:
+    while position < len(buffer) and buffer[position] in _WHITESPACE:
+        position += 1
+    return position
+
+def _decode_value(buffer: str, position: int, is_eof: bool) -> typing.Optional[typing.Tuple[typing.Any, int]]:
+    try:
+        value, end = _DECODER.raw_decode(buffer, position)
+    except json.JSONDecodeError:
+        return None
+
+    # A value that runs up to the end of our buffer might still be cut short (e.g. the number 12 of 123).
+    if not is_eof and _skip_whitespace(buffer, end) >= len(buffer):
+        return None
+    return value, end
+
+def iter_response(chunks: typing.Iterable[bytes]) -> typing.Iterator[typing.Tuple[str, typing.Any]]:
+    """
+    Incrementally parse a query service response, yielding its top-level (key, value) pairs as soon as they have
+    arrived. Entries of the 'results' array are yielded one at a time as ('results', entry), so callers never need to
+    hold the complete response in memory.
+    """
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer, position, is_eof = '', 0, False
+    state, key = 'open', None
+
+    while True:
+        position = _skip_whitespace(buffer, position)
+        is_progress = position < len(buffer)
+        if is_progress:
+            char = buffer[position]
+            if state == 'open':
+                if char != '{':
+                    raise ValueError(f'Unexpected character {char!r} at the start of the response.')
+                position, state = position + 1, 'key'
+
+            elif state == 'key' and char == '}':
+                return
+
+            elif state == 'key':
+                decoded = _decode_value(buffer, position, is_eof)
+                if decoded is None:
+                    is_progress = False
+                else:
+                    (key, position), state = decoded, 'colon'
+
+            elif state == 'colon':
+                if char != ':':
+                    raise ValueError(f'Expected ":" after key {key!r}, found {char!r}.')
+                position, state = position + 1, 'value'
+
+            elif state == 'value' and key == 'results' and char == '[':
+                position, state = position + 1, 'item'
+
+            elif state == 'item' and char == ']':
+                position, state = position + 1, 'next'
+
+            elif state in {'value', 'item'}:
+                decoded = _decode_value(buffer, position, is_eof)
+                if decoded is None:
+                    is_progress = False
+                else:
+                    value, position = decoded
+                    yield key, value
+                    state = 'next' if state == 'value' else 'item-next'
+
+            elif state == 'item-next':
+                if char not in ',]':
+                    raise ValueError(f'Expected "," or "]" between results, found {char!r}.')
+                position, state = position + 1, 'item' if char == ',' else 'next'
+
+            elif state == 'next':
+                if char == '}':
+                    return
+                if char != ',':
+                    raise ValueError(f'Expected "," or "}}" after key {key!r}, found {char!r}.')
+                position, state = position + 1, 'key'
+
+        # We need more data to proceed.
+        if not is_progress:
+            if is_eof:
+                raise ValueError('Query service response ended unexpectedly.')
+            chunk = next(chunks, None)
+            if chunk is None:
+                is_eof = True
+                buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+            else:
+                buffer = buffer[position:] + text_decoder.decode(chunk)
+            position = 0
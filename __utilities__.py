@@ -1,3 +1,5 @@
+import bisect
+import functools
 import pathlib
 import typing
 import requests
@@ -5,14 +7,10 @@ import json
 import bs4
 import re
 
-def scrape_functions() -> typing.Dict:
-    # First, see if we can serve our keywords without scraping...
-    functions_file = pathlib.Path(__file__).parent / 'install/sqlpp-functions.json'
-    if functions_file.exists():
-        with functions_file.open('r') as fp:
-            return json.load(fp)
+FUNCTIONS_FILE = pathlib.Path(__file__).parent / 'install/sqlpp-functions.json'
+KEYWORDS_FILE = pathlib.Path(__file__).parent / 'install/gsqlpp-tokens.json'
 
-    # ...otherwise, we need to scrape.
+def scrape_functions() -> typing.Dict:
     _URL = 'https://nightlies.apache.org/asterixdb/sqlpp/builtins.html'
     page = requests.get(_URL)
     soup = bs4.BeautifulSoup(page.content, 'html.parser')
@@ -73,20 +71,9 @@ def scrape_functions() -> typing.Dict:
 
     for function_obj in functions_dict.values():
         function_class_dict[function_obj['functionClass']].append(function_obj)
-
-    # Save our results.
-    with functions_file.open(mode='w') as fp:
-        json.dump(function_class_dict, fp)
     return function_class_dict
 
 def scrape_keywords() -> typing.List[str]:
-    # First, see if we can serve our keywords without scraping...
-    keywords_file = pathlib.Path(__file__).parent / 'install/gsqlpp-tokens.json'
-    if keywords_file.exists():
-        with keywords_file.open(mode='r') as fp:
-            return json.load(fp)
-
-    # ...otherwise, we need to scrape.
     _URL = 'https://graphix.ics.uci.edu/docs/language-reference/reserved.html'
     page = requests.get(_URL)
     soup = bs4.BeautifulSoup(page.content, 'html.parser')
@@ -96,8 +83,185 @@ def scrape_keywords() -> typing.List[str]:
         if not re.match(r'\w+', keyword.text):
             continue
         keywords_list.append(keyword.text.strip())
-
-    # Save our results.
-    with keywords_file.open(mode='w') as fp:
-        json.dump(keywords_list, fp)
     return keywords_list
+
+def build_catalogs():
+    """ Scrape our function and keyword catalogs into our install folder, i.e. `python3 __utilities__.py`. """
+    FUNCTIONS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with FUNCTIONS_FILE.open(mode='w') as fp:
+        json.dump(scrape_functions(), fp)
+    with KEYWORDS_FILE.open(mode='w') as fp:
+        json.dump(scrape_keywords(), fp)
+
+@functools.cache
+def load_catalogs() -> typing.Tuple[typing.Dict, typing.Dict, typing.List[str], typing.Dict]:
+    """
+    Load our function and keyword catalogs (once per process), along with an index of our functions by name and an
+    inverted index of the words in their names and descriptions.
+    """
+    if not FUNCTIONS_FILE.exists() or not KEYWORDS_FILE.exists():
+        build_catalogs()
+    with FUNCTIONS_FILE.open(mode='r') as fp:
+        function_class_dict = json.load(fp)
+    with KEYWORDS_FILE.open(mode='r') as fp:
+        keywords_list = json.load(fp)
+
+    # Function names are case-insensitive in SQL++.
+    function_index = {
+        function_obj['functionName'].lower(): function_obj
+        for function_list in function_class_dict.values() for function_obj in function_list
+    }
+    search_index = {}
+    for function_key, function_obj in function_index.items():
+        words = _get_words(function_obj['functionName']) + _get_words(function_obj['functionDescription'])
+        for word in words:
+            search_index.setdefault(word, set()).add(function_key)
+    return function_class_dict, function_index, keywords_list, search_index
+
+def _get_words(text: str) -> typing.List[str]:
+    # Names like get_year are also found by their parts (get, year).
+    words = re.findall(r'\w+', text.lower())
+    return words + [p for w in words if '_' in w for p in w.split('_') if p]
+
+def get_functions() -> typing.Dict[str, typing.List[typing.Dict]]:
+    return load_catalogs()[0]
+
+def get_function(function_name: str) -> typing.Optional[typing.Dict]:
+    return load_catalogs()[1].get(function_name.lower())
+
+def get_function_names() -> typing.List[str]:
+    return [f['functionName'] for f in load_catalogs()[1].values()]
+
+def get_keywords() -> typing.List[str]:
+    return load_catalogs()[2]
+
+def search_functions(query: str) -> typing.List[typing.Dict]:
+    """ Find the functions whose names and descriptions contain every word of our query (or a word they start with). """
+    search_index, function_index = load_catalogs()[3], load_catalogs()[1]
+    query_words = re.findall(r'\w+', query.lower())
+    if not query_words:
+        return []
+
+    matches = None
+    indexed_words = _get_sorted_words()
+    for query_word in query_words:
+        word_matches = set()
+        position = bisect.bisect_left(indexed_words, query_word)
+        while position < len(indexed_words) and indexed_words[position].startswith(query_word):
+            word_matches |= search_index[indexed_words[position]]
+            position += 1
+        matches = word_matches if matches is None else matches & word_matches
+
+    # Functions whose name matches our query come first.
+    query_text = '_'.join(query_words)
+    return [function_index[k] for k in sorted(matches, key=lambda k: (query_text not in k, k))]
+
+@functools.cache
+def _get_sorted_words() -> typing.List[str]:
+    return sorted(load_catalogs()[3])
+
+def _scan_statements(statements: str) -> typing.List[typing.Tuple[str, int, int]]:
+    """
+    Split a SQL++ request into its statements, respecting quoted text. Each statement is given without its comments,
+    along with the offsets (in our request) of its start and of just past its last character that is not a comment or
+    whitespace.
+    """
+    statement_list = []
+    current, position, start, code_end = [], 0, 0, 0
+    while position < len(statements):
+        char = statements[position]
+        if char in '\'"`':
+            end = position + 1
+            while end < len(statements) and statements[end] != char:
+                end += 2 if statements[end] == '\\' else 1
+            current.append(statements[position:end + 1])
+            position = code_end = min(end + 1, len(statements))
+        elif statements.startswith('--', position) or statements.startswith('//', position):
+            end = statements.find('\n', position)
+            position = len(statements) if end == -1 else end
+        elif statements.startswith('/*', position):
+            end = statements.find('*/', position + 2)
+            current.append(' ')
+            position = len(statements) if end == -1 else end + 2
+        elif char == ';':
+            statement_list.append((''.join(current).strip(), start, code_end))
+            current, position = [], position + 1
+            start = position
+        else:
+            current.append(char)
+            position += 1
+            if not char.isspace():
+                code_end = position
+    statement_list.append((''.join(current).strip(), start, code_end))
+    return [(s, b, e) for s, b, e in statement_list if s]
+
+def split_statements(statements: str) -> typing.List[str]:
+    """ Split a SQL++ request into its statements, dropping comments and respecting quoted text. """
+    return [s for s, _, _ in _scan_statements(statements)]
+
+def is_ddl(statement: str) -> bool:
+    return re.match(r'(CREATE|DROP|ALTER|ANALYZE)\b', statement, flags=re.IGNORECASE) is not None
+
+def is_read_only(statement: str) -> bool:
+    return re.match(r'(SELECT|FROM|MATCH|WITH|LET|USE|SET|EXPLAIN)\b|\(', statement, flags=re.IGNORECASE) is not None
+
+def normalize_statements(statements: str) -> str:
+    """ Normalize a SQL++ request for use as a cache key, collapsing whitespace outside of quoted text. """
+    return '; '.join(
+        re.sub(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`)|\s+', lambda m: m.group(1) or ' ', s)
+        for s in split_statements(statements)
+    ) + ';'
+
+def get_graph_names(statements: str) -> typing.List[typing.Tuple[str, str]]:
+    """ Find the (dataverse, graph) names of the managed graphs a SQL++ request queries, following its USE statements. """
+    identifier = r'(?:`[^`]+`|[A-Za-z_][\w$]*)'
+    graph_names, dataverse_name = [], 'Default'
+    for statement in split_statements(statements):
+        use_match = re.match(rf'USE\s+({identifier}(?:\.{identifier})*)\s*$', statement, flags=re.IGNORECASE)
+        if use_match is not None:
+            dataverse_name = '/'.join(p.strip('`') for p in re.findall(identifier, use_match.group(1)))
+            continue
+        for graph_match in re.finditer(rf'\bFROM\s+GRAPH\s+(?!(?:VERTEX|EDGE)\b)({identifier}(?:\.{identifier})*)',
+                                       statement, flags=re.IGNORECASE):
+            name_parts = [p.strip('`') for p in re.findall(identifier, graph_match.group(1))]
+            graph_name = ('/'.join(name_parts[:-1]) or dataverse_name, name_parts[-1])
+            if graph_name not in graph_names:
+                graph_names.append(graph_name)
+    return graph_names
+
+def _is_query(statement: str) -> bool:
+    return re.match(r'(SELECT|FROM|MATCH|WITH)\b|\(', statement, flags=re.IGNORECASE) is not None
+
+def _find_top_level(statement: str, keyword: str) -> typing.Optional[int]:
+    # Our keyword only counts outside of quoted text, comments and nested expressions (e.g. subqueries).
+    depth = 0
+    for token in re.finditer(rf'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`|(?:--|//)[^\n]*|/\*.*?(?:\*/|$)|'
+                             rf'[(\[{{]|[)\]}}]|\b{keyword}\b', statement, flags=re.IGNORECASE | re.DOTALL):
+        if token.group() in '([{':
+            depth += 1
+        elif token.group() in ')]}':
+            depth -= 1
+        elif depth == 0 and token.group().upper() == keyword:
+            return token.start()
+    return None
+
+def limit_statements(statements: str, row_limit: int) -> str:
+    """ Append a LIMIT to the final query of a SQL++ request, unless it already limits itself. """
+    statement_list = _scan_statements(statements)
+    if not statement_list:
+        return statements
+    last_statement, start, code_end = statement_list[-1]
+    if not _is_query(last_statement) or _find_top_level(statements[start:code_end], 'LIMIT') is not None:
+        return statements
+
+    # Our LIMIT goes right after the last token of our query (or before its OFFSET, which must follow a LIMIT), so that
+    # the rest of our request (e.g. its comments and optimizer hints) is sent as it was written.
+    offset_start = _find_top_level(statements[start:code_end], 'OFFSET')
+    if offset_start is not None:
+        offset_start += start
+        return f'{statements[:offset_start]}LIMIT {row_limit} {statements[offset_start:]}'
+    return f'{statements[:code_end]}\nLIMIT {row_limit}{statements[code_end:]}'
+
+
+if __name__ == '__main__':
+    build_catalogs()
@@ -1,35 +1,92 @@
-from dash import html
+import functools
+import math
+import dash
+from dash import html, ctx
 import dash_bootstrap_components as bootstrap
 import __utilities__ as utilities
+from __global__ import *
 
+_PAGE_SIZE = 20
 
+
+@app.callback(
+    dash.Output('function-list', 'children'),
+    dash.Output('function-pagination', 'max_value'),
+    dash.Output('function-pagination', 'active_page'),
+    dash.Input('function-search', 'value'),
+    dash.Input('function-class', 'value'),
+    dash.Input('function-pagination', 'active_page'),
+)
+def _show_functions(search_query, function_class, active_page):
+    # A new search (or class) starts from its first page.
+    if ctx.triggered_id != 'function-pagination' or not active_page:
+        active_page = 1
+
+    # Our search covers every class of function, otherwise we only show the class that has been selected.
+    if search_query and search_query.strip():
+        function_list = utilities.search_functions(search_query)
+        if not function_list:
+            return html.P(f'No functions match "{search_query}".', className="lead"), 1, 1
+    else:
+        function_list = utilities.get_functions().get(function_class, [])
+
+    # Only one page of our functions is in the DOM at a time.
+    page_count = max(math.ceil(len(function_list) / _PAGE_SIZE), 1)
+    active_page = min(active_page, page_count)
+    page = function_list[(active_page - 1) * _PAGE_SIZE: active_page * _PAGE_SIZE]
+    return [_build_function(f) for f in page], page_count, active_page
+
+def _build_function(function):
+    return bootstrap.Container(
+        [
+            html.H1(function["functionName"], className="display-6"),
+            html.P(function["functionDescription"], className="lead"),
+            html.Hr(className="my-2"),
+            html.P(function["functionText"], className="small", style={"white-space": "pre-wrap"}),
+        ],
+        fluid=True,
+        className="py-2",
+    )
+
+
+# Our function catalog does not change while we are running, so our page is only built once.
+@functools.cache
 def build_page():
-    table_of_contents = []
-    body = []
-
-    for function_class, function_list in utilities.scrape_functions().items():
-        table_of_contents.append(html.Li(html.A(function_class, href=f"#{function_class}")))
-        body.append(html.Br())
-        body.append(html.Br())
-        body.append(html.A(html.H2(function_class), id=function_class))
-        body.append(html.Br())
-
-        for function in function_list:
-            jumbotron = bootstrap.Container(
+    function_classes = list(utilities.get_functions().keys())
+    return bootstrap.Container(
+        children=[
+            html.H1("Builtin Functions"),
+            html.Br(),
+            bootstrap.Row(
                 [
-                    html.H1(function["functionName"], className="display-6"),
-                    html.P(function["functionDescription"], className="lead"),
-                    html.Hr(className="my-2"),
-                    html.P(function["functionText"], className="small", style={"white-space": "pre-wrap"}),
+                    bootstrap.Col(
+                        bootstrap.Input(
+                            id='function-search',
+                            type='search',
+                            placeholder='Search by name or description...',
+                            debounce=True,
+                        ),
+                        width=6
+                    ),
+                    bootstrap.Col(
+                        bootstrap.Select(
+                            id='function-class',
+                            options=[{'label': c, 'value': c} for c in function_classes],
+                            value=function_classes[0] if function_classes else None,
+                        ),
+                        width=4
+                    ),
                 ],
-                fluid=True,
-                className="py-2",
-            )
-            body.append(jumbotron)
-
-    body = [html.H1("Builtin Functions"), html.Br(), html.H2("Table of Contents"), html.Ul(table_of_contents)] + body
-    
-    return bootstrap.Container(
-        children=body,
+                className='mb-3',
+            ),
+            html.Div(id='function-list'),
+            bootstrap.Pagination(
+                id='function-pagination',
+                max_value=1,
+                active_page=1,
+                fully_expanded=False,
+                className='my-3',
+            ),
+        ],
         fluid=True,
     )
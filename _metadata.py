@@ -1,59 +1,75 @@
+import concurrent.futures
+import functools
+import time
 import json
 import dash
 import visdcc
-import pathlib
-import requests
-from dash import html, dcc
+from dash import html, dcc, ctx
 import dash_loading_spinners as spinners
 import dash_bootstrap_components as bootstrap
+import __cluster__ as cluster
+import __cache__ as cache
 from __errors__ import *
 from __global__ import *
 
+_NAME_ATTRIBUTES = {"Dataset": "DatasetName", "Datatype": "DatatypeName", "Graph": "GraphName"}
+
 class _MetadataPage:
     def __call__(self, *args, **kwargs):
         return ''
 
+def _query_catalog(cache_key, query_str):
+    # Our catalog rarely changes, so we serve it from our cache when we can.
+    results = cache.get_metadata(cache_key)
+    if results is not None:
+        return results
+    response = cluster.post_statement(query_str).json()
+    if response['status'] != 'success':
+        raise GraphixStatementError(response)
+    cache.put_metadata(cache_key, response['results'])
+    return response['results']
+
 def get_metadata(dataverse, dataset, limit=None):
-    settings_file = pathlib.Path(__file__).parent / 'settings/graphix.json'
-    if not settings_file.exists():
-        raise FileNotFoundError(settings_file.name)
-    
-    # Grab our client information.
-    with settings_file.open('r') as fp:
-        settings_json = json.load(fp)
-        cluster_uri = f"http://{settings_json['cluster']['address']}:" \
-                      f"{settings_json['cluster']['port']}/query/service"
-    
-    # Issue our query.
     query_str = f"use `{dataverse}`; select value d from `{dataset}` d;"
     if limit is not None:
         query_str = f"use `{dataverse}`; select value d from `{dataset}` d limit {limit};"
-    api_parameters = {'statement': 'SET `graphix.compiler.add-context` "true"; ' + query_str}
-    response = requests.post(cluster_uri, api_parameters).json()
+    if dataverse == 'Metadata':
+        return _query_catalog((dataverse, dataset, limit), query_str)
+
+    # Issue our query.
+    response = cluster.post_statement(query_str).json()
     if response['status'] != 'success':
         raise GraphixStatementError(response)
     return response['results']
 
-def get_name(item):
-    attribute_name_list = ["DatasetName", "DatatypeName", "GraphName"]
-    for attribute_name in attribute_name_list:
-        if item.get(attribute_name):
-            return item.get(attribute_name)
-    return "UNDEFINED"
+def get_metadata_names(dataverse_name, metadata_type):
+    name_attribute = _NAME_ATTRIBUTES[metadata_type]
+    query_str = f"use `Metadata`; select value d.`{name_attribute}` from `{metadata_type}` d " \
+                f"where d.DataverseName = {json.dumps(dataverse_name)} order by d.`{name_attribute}`;"
+    return _query_catalog(('names', dataverse_name, metadata_type), query_str)
+
+def get_metadata_record(dataverse_name, metadata_type, name):
+    name_attribute = _NAME_ATTRIBUTES[metadata_type]
+    query_str = f"use `Metadata`; select value d from `{metadata_type}` d " \
+                f"where d.DataverseName = {json.dumps(dataverse_name)} and d.`{name_attribute}` = {json.dumps(name)};"
+    records = _query_catalog(('record', dataverse_name, metadata_type, name), query_str)
+    return records[0] if records else None
 
 
 @app.callback(
     dash.Output('choice', 'children'),
-    dash.Output({"dataverse": dash.ALL, "type": "Dataset", "idx": dash.ALL}, 'n_clicks'),
-    dash.Input({"dataverse": dash.ALL, "type": "Dataset", "idx": dash.ALL}, 'n_clicks'),
-    dash.State({"dataverse": dash.ALL, "type": "Dataset", "idx": dash.ALL}, 'data-detail'),
+    dash.Output({"dataverse": dash.ALL, "type": "Dataset", "name": dash.ALL}, 'n_clicks'),
+    dash.Input({"dataverse": dash.ALL, "type": "Dataset", "name": dash.ALL}, 'n_clicks'),
     prevent_initial_call=True,
     running=[(dash.Output('detail-spinner', 'children'), spinners.Grid(color='#325d88'), None)]
 )
-def _dataset_detail(n_clicks, data):
+def _dataset_detail(n_clicks):
     for i in range(len(n_clicks)):
         if n_clicks[i]:
-            detail = data[i]
+            item_id = ctx.inputs_list[0][i]['id']
+            detail = get_metadata_record(item_id["dataverse"], "Dataset", item_id["name"])
+            if detail is None:
+                break
             sample = get_metadata(detail["DataverseName"], detail["DatasetName"], 1)
             jumbotron = bootstrap.Container(
                 [
@@ -77,16 +93,18 @@ def _dataset_detail(n_clicks, data):
 
 @app.callback(
     dash.Output('choice', 'children', allow_duplicate=True),
-    dash.Output({"dataverse": dash.ALL, "type": "Datatype", "idx": dash.ALL}, 'n_clicks'),
-    dash.Input({"dataverse": dash.ALL, "type": "Datatype", "idx": dash.ALL}, 'n_clicks'),
-    dash.State({"dataverse": dash.ALL, "type": "Datatype", "idx": dash.ALL}, 'data-detail'),
+    dash.Output({"dataverse": dash.ALL, "type": "Datatype", "name": dash.ALL}, 'n_clicks'),
+    dash.Input({"dataverse": dash.ALL, "type": "Datatype", "name": dash.ALL}, 'n_clicks'),
     prevent_initial_call=True,
     running=[(dash.Output('detail-spinner', 'children'), spinners.Grid(color='#325d88'), None)]
 )
-def _datatype_detail(n_clicks, data):
+def _datatype_detail(n_clicks):
     for i in range(len(n_clicks)):
         if n_clicks[i]:
-            detail = data[i]
+            item_id = ctx.inputs_list[0][i]['id']
+            detail = get_metadata_record(item_id["dataverse"], "Datatype", item_id["name"])
+            if detail is None:
+                break
             try:
                 fields = detail["Derived"]["Record"]["Fields"]
             except KeyError:
@@ -116,16 +134,18 @@ def _datatype_detail(n_clicks, data):
 
 @app.callback(
     dash.Output('choice', 'children', allow_duplicate=True),
-    dash.Output({"dataverse": dash.ALL, "type": "Graph", "idx": dash.ALL}, 'n_clicks'),
-    dash.Input({"dataverse": dash.ALL, "type": "Graph", "idx": dash.ALL}, 'n_clicks'),
-    dash.State({"dataverse": dash.ALL, "type": "Graph", "idx": dash.ALL}, 'data-detail'),
+    dash.Output({"dataverse": dash.ALL, "type": "Graph", "name": dash.ALL}, 'n_clicks'),
+    dash.Input({"dataverse": dash.ALL, "type": "Graph", "name": dash.ALL}, 'n_clicks'),
     prevent_initial_call=True,
     running=[(dash.Output('detail-spinner', 'children'), spinners.Grid(color='#325d88'), None)]
 )
-def _graph_detail(n_clicks, data):
+def _graph_detail(n_clicks):
     for i in range(len(n_clicks)):
         if n_clicks[i]:
-            detail = data[i]
+            item_id = ctx.inputs_list[0][i]['id']
+            detail = get_metadata_record(item_id["dataverse"], "Graph", item_id["name"])
+            if detail is None:
+                break
             nodes = [{
                 "id": node["Label"],
                 "label": node["Label"],
@@ -173,6 +193,15 @@ def _graph_detail(n_clicks, data):
             return jumbotron, [None for item in n_clicks]
     return None, [None for item in n_clicks]
 
+@app.callback(
+    dash.Output('page-content', 'children', allow_duplicate=True),
+    dash.Input('refresh-metadata', 'n_clicks'),
+    prevent_initial_call=True,
+)
+def _refresh_metadata(n_clicks):
+    cache.invalidate_metadata()
+    return build_page()
+
 @app.callback(
     dash.Output('graph_definition', 'options'),
     dash.Input('graphSettings', 'data'),
@@ -182,43 +211,73 @@ def _load_graph_settings(settings):
     return settings
 
 
-def build_page():
-    metadata_dict = {}
-    metadata_type_list = ["Dataset", "Datatype", "Graph"]
+@app.callback(
+    dash.Output({"dataverse-children": dash.ALL}, 'children'),
+    dash.Input('metadata-accordion', 'active_item'),
+    dash.State({"dataverse-children": dash.ALL}, 'children'),
+    prevent_initial_call=True,
+    running=[(dash.Output('detail-spinner', 'children'), spinners.Grid(color='#325d88'), None)]
+)
+def _load_dataverse(active_item, children):
+    # A dataverse's names are only fetched once it is expanded, its details only once they are clicked.
+    output_list = []
+    for output, current in zip(ctx.outputs_list, children):
+        dataverse = output['id']['dataverse-children']
+        if dataverse != active_item or current:
+            output_list.append(dash.no_update)
+            continue
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(_NAME_ATTRIBUTES)) as executor:
+            name_futures = {t: executor.submit(get_metadata_names, dataverse, t) for t in _NAME_ATTRIBUTES}
+            output_list.append(
+                bootstrap.Accordion(
+                    [
+                        bootstrap.AccordionItem(
+                            [
+                                html.Div(
+                                    name,
+                                    className="metadata-list-item",
+                                    id={"dataverse": dataverse, "type": group_name, "name": name}
+                                ) for name in name_future.result()
+                            ],
+                            title=group_name,
+                        ) for group_name, name_future in name_futures.items()
+                    ]
+                )
+            )
+    return output_list
 
-    for dataverse in get_metadata("Metadata", "Dataverse"):
-        metadata_dict[dataverse['DataverseName']] = {"Dataset": [], "Datatype": [], "Graph": []}
 
-    for metadata_type in metadata_type_list:
-        for metadata in get_metadata("Metadata", metadata_type):
-            dataverse_name = metadata["DataverseName"]
-            metadata_dict[dataverse_name][metadata_type].append(metadata)
+def build_page():
+    # Our page is rebuilt whenever the metadata it lists has been invalidated or has expired.
+    expire = load_settings().get('metadata', {}).get('expire')
+    return _build_page(cache.get_metadata_generation(), int(time.time() // expire) if expire else 0)
 
+@functools.lru_cache(maxsize=1)
+def _build_page(generation, period):
     return bootstrap.Row(
         [
             bootstrap.Col(
-                bootstrap.Accordion(
-                    [
-                        bootstrap.AccordionItem(
-                            bootstrap.Accordion(
-                                [
-                                    bootstrap.AccordionItem(
-                                        [
-                                            html.Div(
-                                                get_name(item),
-                                                **{"data-detail": item},
-                                                className="metadata-list-item",
-                                                id={"dataverse": dataverse, "type": group_name, "idx": idx}
-                                            ) for idx, item in enumerate(value)
-                                        ],
-                                        title=group_name,
-                                    ) for group_name, value in groups.items()
-                                ]
-                            ),
-                            title=dataverse,
-                        ) for dataverse, groups in metadata_dict.items()
-                    ],
-                ),
+                [
+                    bootstrap.Button(
+                        [html.Span(className="bi bi-arrow-clockwise"), " Refresh Metadata"],
+                        id='refresh-metadata',
+                        color='secondary',
+                        size='sm',
+                        className='my-2',
+                    ),
+                    bootstrap.Accordion(
+                        [
+                            bootstrap.AccordionItem(
+                                html.Div(id={"dataverse-children": dataverse['DataverseName']}),
+                                title=dataverse['DataverseName'],
+                                item_id=dataverse['DataverseName'],
+                            ) for dataverse in get_metadata("Metadata", "Dataverse")
+                        ],
+                        id='metadata-accordion',
+                        start_collapsed=True,
+                    ),
+                ],
                 width=4
             ), 
             bootstrap.Col(
@@ -1,36 +1,102 @@
 import math
 
+import functools
 import visdcc
 import pandas
 import flatten_json
 import dash.html as html
 import dash_ace
 import dash
-import requests
+from dash import ctx
 import typing
 import pathlib
 import json
 import re
 import math
-import diskcache
+import uuid
+import time
 
 from dash_bootstrap_templates import ThemeSwitchAIO
 import dash_bootstrap_components as bootstrap
 import dash_loading_spinners as spinners
 import __utilities__ as utilities
+import __stream__ as stream
+import __graph__ as graph
+import __cache__ as cache
+import __cluster__ as cluster
+import __jobs__ as jobs
 from __global__ import *
 from __errors__ import *
 from _metadata import get_metadata
 
-_callback_manager = dash.DiskcacheManager(diskcache.Cache())
+_STREAM_CHUNK_SIZE = 64 * 1024
+_TABLE_PAGE_SIZE = 50
 
+# Tooltips are only rendered once an element is hovered over (or selected). Elements without their document are
+# described by the server, through our network's event0 property. Double-clicking a vertex asks the server for its
+# neighbors, through our network's event1 property.
+_TOOLTIP_SCRIPT = """
+if (!this.net.graphixTooltips) {
+    var network = this.net, nodes = this.nn, edges = this.ee;
+    var toTitle = function (data) { return '<pre><code>' + JSON.stringify(data, null, 2) + '</code></pre>'; };
+    this.net.on('hoverNode', function (p) {
+        var node = nodes.get(p.node);
+        if (!node || node.title) return;
+        if (node.data !== undefined) nodes.update({id: node.id, title: toTitle(node.data)});
+        else if (!network.graphixStreaming) setProps({event0: {nodes: [node.id], edges: []}});
+    });
+    this.net.on('hoverEdge', function (p) {
+        var edge = edges.get(p.edge);
+        if (!edge || edge.title) return;
+        if (edge.data !== undefined) edges.update({id: edge.id, title: toTitle(edge.data)});
+        else if (!network.graphixStreaming) setProps({event0: {nodes: [], edges: [edge.id]}});
+    });
+    this.net.on('doubleClick', function (p) {
+        if (p.nodes.length === 1 && typeof p.nodes[0] === 'number' && !network.graphixStreaming)
+            setProps({event1: {nodes: p.nodes, edges: []}});
+    });
+    this.net.graphixTooltips = true;
+}
+this.net.graphixStreaming = false;
+"""
+
+
+def _get_changed_options(settings, options):
+    return {k for k in settings.keys() | options.keys() if settings.get(k) != options.get(k)}
 
 @app.callback(
     dash.Output('net', 'options'),
+    dash.Output('graphStyles', 'data'),
     dash.Input('graphSettings', 'data'),
+    dash.State('net', 'options'),
 )
-def _load_graph_settings(settings):
-    return settings
+def _load_graph_settings(settings, options):
+    # Setting our options restarts the simulation of our network, so this is avoided for changes in styling alone.
+    if 'groups' in options and _get_changed_options(settings, options) <= {'groups'}:
+        raise dash.exceptions.PreventUpdate
+    return settings, settings.get('groups', {})
+
+@app.callback(
+    dash.Output('net', 'run', allow_duplicate=True),
+    dash.Output('graphStyles', 'data', allow_duplicate=True),
+    dash.Input('graphSettings', 'data'),
+    dash.State('net', 'options'),
+    dash.State('graphStyles', 'data'),
+    prevent_initial_call=True,
+)
+def _update_graph_styles(settings, options, styles):
+    if 'groups' not in options or _get_changed_options(settings, options) != {'groups'}:
+        raise dash.exceptions.PreventUpdate
+
+    # Only the groups whose style differs from the styles our network was last given are set. These are not written
+    # back to our network's options property (which would set all of our options again), but to our graphStyles.
+    groups = {k: v for k, v in settings['groups'].items() if (styles or {}).get(k) != v}
+    if not groups:
+        raise dash.exceptions.PreventUpdate
+    styles_patch = dash.Patch()
+    for label, group in groups.items():
+        styles_patch[label] = group
+    return f"this.net.setOptions({{groups: {json.dumps(groups)}}});", styles_patch
 
 @app.callback(
     dash.Output('graphSettings', 'data'),
@@ -41,173 +107,592 @@ def _load_node_labels(pathname, settings):
     if pathname != QUERY_DIRECTORY:
         raise dash.exceptions.PreventUpdate
 
-    if 'groups' not in settings:
-        settings['groups'] = {}
-    color_map = settings['groups']
+    # Only the labels we have not seen before are added to our settings.
+    color_map = settings.get('groups', {})
+    new_groups = {}
     graphs = get_metadata('Metadata', 'Graph')
     for graph in graphs:
         for node in graph['Vertices']:
-            if node['Label'] not in color_map:
-                color_map[node['Label']] = {
+            if node['Label'] not in color_map and node['Label'] not in new_groups:
+                new_groups[node['Label']] = {
                     'borderWidth': 0,
                     'color': {'background': '#97C2FC'},
                 }
-    return settings
+    if not new_groups and 'groups' in settings:
+        raise dash.exceptions.PreventUpdate
+
+    settings_patch = dash.Patch()
+    if 'groups' not in settings:
+        settings_patch['groups'] = new_groups
+    else:
+        for label, group in new_groups.items():
+            settings_patch['groups'][label] = group
+    return settings_patch
 
 @app.callback(
     dash.Output('queryResults', 'data'),
     dash.Output('graphData', 'data'),
+    dash.Output('cacheIndicator', 'style'),
     dash.Input('runButton', 'n_clicks'),
+    dash.Input('rerunButton', 'n_clicks'),
     dash.State('queryInput', 'value'),
     dash.State('node-limit', 'data'),
+    dash.State('query-cache', 'data'),
+    dash.State('fetchAllSwitch', 'value'),
+    dash.State('edge-aggregation', 'data'),
+    dash.State('queryContext', 'data'),
+    dash.State('server-layout', 'data'),
     prevent_initial_call=True,
-    manager=_callback_manager,
+    manager=jobs.manager,
     background=True,
+    progress=[dash.Output('queryContext', 'data'), dash.Output('queryProgress', 'data')],
+    cancel=[dash.Input('cancelButton', 'n_clicks')],
     running=[
-        (dash.Output('runButton', 'disabled'), True, False),
+        (dash.Output('rerunButton', 'disabled'), True, False),
+        (dash.Output('cancelButton', 'style'), {'display': 'block'}, {'display': 'none'}),
         (dash.Output('outputPaneSpinner', 'children'), spinners.Grid(color='#325d88'), None),
-        (dash.Output('net', 'style'), {'display': 'none'}, {'display': 'block'}),
         (dash.Output('tableDiv', 'style'), {'display': 'none'}, {'display': 'block'}),
     ]
 )
-def _execute_query(n_clicks, query_input, node_limit):
-    settings_file = pathlib.Path(__file__).parent / 'settings/graphix.json'
-    if not settings_file.exists():
-        raise FileNotFoundError(settings_file.name)
+def _execute_query(set_progress, n_clicks, rerun_clicks, query_input, node_limit, use_query_cache, is_fetch_all,
+                   is_aggregating, previous_context_id, use_server_layout):
+    settings_json = load_settings()
 
     # Don't proceed if our query-text is empty.
     if query_input is None or (query_input is str and len(query_input) == 0) or n_clicks < 1:
         raise dash.exceptions.PreventUpdate
 
-    # Grab our client information.
-    with settings_file.open('r') as fp:
-        settings_json = json.load(fp)
-        cluster_uri = f"http://{settings_json['cluster']['address']}:" \
-                      f"{settings_json['cluster']['port']}/query/service"
+    # A query that is still running has been superseded by this one (Dash has already stopped waiting on it).
+    _cancel_request(previous_context_id)
+
+    # Read-only statements can be served from our query cache, unless we have been asked to re-run them.
+    statement_list = utilities.split_statements(query_input)
+    is_ddl = any(utilities.is_ddl(s) for s in statement_list)
+    is_read_only = all(utilities.is_read_only(s) for s in statement_list)
+    query_key = (utilities.normalize_statements(query_input), node_limit, bool(is_fetch_all), bool(is_aggregating),
+                 cluster.get_cluster_uri('/'))
+    if use_query_cache and is_read_only and ctx.triggered_id != 'rerunButton':
+        handle = cache.get_query(query_key)
+        if handle is not None:
+            if use_server_layout:
+                _prepare_layout(handle)
+            return handle, handle, {'display': 'block'}
+
+    # Unless we want every row, the cluster only needs to produce enough rows to fill our graph.
+    if not is_fetch_all:
+        row_limit = node_limit * settings_json['query'].get('row-limit-factor', 2)
+        query_input = utilities.limit_statements(query_input, row_limit)
+
+    # Issue our query under a client_context_id of our own, so that it can be cancelled on the cluster.
+    client_context_id = uuid.uuid4().hex
+    cache.put_request(client_context_id)
+    set_progress((client_context_id, None))
+    try:
+        if settings_json['query'].get('stream', False):
+            handle = _stream_query(query_input, node_limit, is_aggregating, is_fetch_all, client_context_id,
+                                   set_progress)
+        else:
+            handle = _buffer_query(query_input, node_limit, is_aggregating, client_context_id)
+    except GraphixStatementError:
+        # A query that was cancelled out from under us has nothing to show.
+        if not cache.is_request_running(client_context_id):
+            raise dash.exceptions.PreventUpdate
+        raise
+    finally:
+        cache.remove_request(client_context_id)
+
+        # Statements that change our catalog or our data make our cached metadata and results stale.
+        if is_ddl:
+            cache.invalidate_metadata()
+        if not is_read_only:
+            cache.invalidate_queries()
+
+    # Vertices can later be expanded using the graphs our query ran against.
+    cache.put_graph_names(handle, utilities.get_graph_names(query_input))
+    cache.put_aggregating(handle, is_aggregating)
+    if use_query_cache and is_read_only:
+        cache.put_query(query_key, handle)
+    if use_server_layout:
+        _prepare_layout(handle)
+    return handle, handle, {'display': 'none'}
+
+def _prepare_layout(handle):
+    # Our nodes are placed in our background job, rather than when our graph is first drawn.
+    graph_data, view = _get_view(handle, cache.get_graph(handle), [])
+    if graph_data['nodes']:
+        _get_layout(handle, view, graph_data)
+
+def _cancel_request(client_context_id):
+    if cache.is_request_running(client_context_id):
+        cache.remove_request(client_context_id)
+        cluster.cancel_statement(client_context_id)
+
+@app.callback(
+    dash.Output('queryContext', 'data', allow_duplicate=True),
+    dash.Input('cancelButton', 'n_clicks'),
+    dash.State('queryContext', 'data'),
+    prevent_initial_call=True,
+)
+def _cancel_query(n_clicks, client_context_id):
+    if n_clicks < 1:
+        raise dash.exceptions.PreventUpdate
+    _cancel_request(client_context_id)
+    return None
+
+@app.callback(
+    dash.Output('queryContext', 'data', allow_duplicate=True),
+    dash.Input('url', 'pathname'),
+    dash.State('queryContext', 'data'),
+    prevent_initial_call=True,
+)
+def _abandon_query(pathname, client_context_id):
+    # Nobody is left to see the results of a query whose page we have left.
+    if pathname == QUERY_DIRECTORY or client_context_id is None:
+        raise dash.exceptions.PreventUpdate
+    _cancel_request(client_context_id)
+    return None
 
-    # Issue our query.
-    api_parameters = {'statement': 'SET `graphix.compiler.add-context` "true"; ' + query_input}
-    response = requests.post(cluster_uri, api_parameters).json()
+def _buffer_query(query_input, node_limit, is_aggregating, client_context_id):
+    response = cluster.post_statement(query_input, client_context_id=client_context_id).json()
     if response['status'] != 'success':
         raise GraphixStatementError(response)
     if not response.get('results'):
-        return {}, {'nodes': [], 'edges': []}
-    
-    # Store variable names representing nodes and edges.
-    node_variables = {
-        node["graphElement"]["variable"]: node["graphElement"]["labels"][0] 
-        for node in response["graphix"]["patterns"]["vertices"]
-    }
-    edge_variables = {
-        edge["graphElement"]["variable"]: {
-            "label": edge["graphElement"]["labels"][0], 
-            "from": edge["edgeElement"]["leftVertex"]["variable"], 
-            "to": edge["edgeElement"]["rightVertex"]["variable"]
-        } 
-        for edge in response["graphix"]["patterns"]["edges"]
-    }
-    if not edge_variables:
-        edge_variables = {
-            edge["graphElement"]["variable"]: {
-                "label": edge["graphElement"]["labels"][0], 
-                "from": edge["edgeElement"]["leftVertex"]["variable"], 
-                "to": edge["edgeElement"]["rightVertex"]["variable"]
-            } 
-            for edge in response["graphix"]["patterns"]["paths"]
-        }
+        return cache.put_result([], {'nodes': [], 'edges': []})
 
     # Turn query result into nodes and edges.
-    idx = 0
-    nodes = {}
-    edges = []
+    vertex_keys = graph.get_vertex_keys(get_metadata('Metadata', 'Graph'))
+    graph_builder = graph.GraphBuilder(response["graphix"]["patterns"], node_limit, vertex_keys, is_aggregating)
     for entry in response['results']:
-        # Go through each node, cache each node's id.
-        id_dict = {}
-        for variable, node in entry.items():
-            if idx >= node_limit:
-                break
-            if variable[0] == '$':
-                variable = '#' + variable[1:]
-            if variable in node_variables:
-                node_tuple = json.dumps(node)
-                if node_tuple in nodes:
-                    id_dict[variable] = nodes[node_tuple]["id"]
-                else:
-                    idx += 1
-                    id_dict[variable] = idx
-                    label = node['name'] if 'name' in node else f"{node_variables[variable]}-{idx}"
-                    title_json = json.dumps(node, indent=2)
-                    nodes[node_tuple] = {
-                        "id": idx,
-                        "data": node,
-                        "label": "\n".join(label.split()),
-                        "group": node_variables[variable],
-                        "title": f"<pre><code>{title_json}</code></pre>"
-                    }
-        # Go through each edge.
-        for variable, edge in entry.items():
-            if variable[0] == '$':
-                variable = '#' + variable[1:]
-            if variable in edge_variables:
-                edge_definition = edge_variables[variable]
-                label = edge_definition["label"]
-                if edge_definition["from"] not in id_dict or edge_definition["to"] not in id_dict:
-                    continue
-                title_json = json.dumps(edge, indent=2)
-                edges.append({
-                    "from": id_dict[edge_definition["from"]],
-                    "to": id_dict[edge_definition["to"]],
-                    "data": edge,
-                    "label": label,
-                    "title": f"<pre><code>{title_json}</code></pre>"
-                })
-
-    return response['results'], {'nodes': list(nodes.values()), 'edges': edges}
-
-def get_name(obj):
-    return obj['name']
+        if graph_builder.is_full:
+            break
+        graph_builder.add_entry(entry)
+    graph_data = graph_builder.to_dict()
+
+    # Our results stay on the server, the browser only holds a handle to them.
+    return cache.put_result(response['results'], graph_data)
+
+def _stream_query(query_input, node_limit, is_aggregating, is_fetch_all, client_context_id, set_progress):
+    results = []
+    response_json = {}
+    graph_builder = None
+    vertex_keys = graph.get_vertex_keys(get_metadata('Metadata', 'Graph'))
+    graph_publisher = _GraphPublisher(client_context_id, set_progress)
+    with cluster.post_statement(query_input, stream=True, client_context_id=client_context_id) as response:
+        for key, value in stream.iter_response(response.iter_content(chunk_size=_STREAM_CHUNK_SIZE)):
+            if key == 'graphix':
+                # Our patterns may arrive after some results, so we catch up on those here.
+                graph_builder = graph.GraphBuilder(value['patterns'], node_limit, vertex_keys, is_aggregating)
+                for entry in results:
+                    if graph_builder.is_full:
+                        break
+                    graph_builder.add_entry(entry)
+            elif key != 'results':
+                response_json[key] = value
+            else:
+                results.append(value)
+                if graph_builder is not None and not graph_builder.is_full:
+                    graph_builder.add_entry(value)
+
+            # Stop reading from the cluster once our graph cannot grow any further, unless we want every row.
+            if graph_builder is not None:
+                graph_publisher.publish(graph_builder)
+                if graph_builder.is_full and not is_fetch_all:
+                    break
+
+    # If we stopped early, our results have already told us that the query succeeded.
+    if 'errors' in response_json or response_json.get('status', 'success') != 'success':
+        raise GraphixStatementError(response_json)
+    if graph_builder is None:
+        return cache.put_result(results, {'nodes': [], 'edges': []})
+    graph_publisher.publish(graph_builder, is_final=True)
+    return cache.put_result(results, graph_builder.to_dict())
+
+class _GraphPublisher:
+    """ Publishes the nodes and edges a streaming query has built so far, in batches our browser can poll for. """
+
+    def __init__(self, client_context_id, set_progress):
+        self.client_context_id = client_context_id
+        self.set_progress = set_progress
+        self.interval = load_settings().get('graph', {}).get('progress-interval', 0.5)
+        self.is_lean = load_settings().get('graph', {}).get('lazy-details', False)
+        self.cluster_threshold = load_settings().get('graph', {}).get('cluster-threshold')
+        self.batch_count = 0
+        self.node_count = 0
+        self.edge_count = 0
+        self.edge_values = {}
+        self.last_publish = 0
+
+        self.set_progress((client_context_id, {'context': client_context_id, 'batches': 0}))
+
+    def publish(self, graph_builder, is_final=False):
+        # A graph that is too large to draw vertex by vertex is only drawn (as super-nodes) once it is complete.
+        if self.cluster_threshold is not None and len(graph_builder.nodes) > self.cluster_threshold:
+            return
+
+        # Our first vertices are shown as soon as we have them, after which we only publish every so often.
+        if not is_final and (self.node_count == len(graph_builder.nodes) or
+                             (self.node_count > 0 and time.monotonic() - self.last_publish < self.interval)):
+            return
+        nodes = list(graph_builder.nodes.values())[self.node_count:]
+        edges = list(graph_builder.edges.values())
+        batch_edges = edges[self.edge_count:]
+        if graph_builder.is_aggregating:
+            # Aggregate edges that we have already published may have since absorbed more parallel edges.
+            batch_edges = [e for e in edges[:self.edge_count] if e['value'] != self.edge_values[e['id']]] + batch_edges
+            self.edge_values.update((e['id'], e['value']) for e in batch_edges)
+        if not nodes and not batch_edges:
+            return
+
+        batch = {
+            'nodes': _get_view_elements(nodes, self.is_lean),
+            'edges': _get_view_elements(batch_edges, self.is_lean),
+        }
+        cache.put_batch(self.client_context_id, self.batch_count, batch)
+        self.batch_count, self.node_count, self.edge_count = self.batch_count + 1, len(graph_builder.nodes), len(edges)
+        self.last_publish = time.monotonic()
+        self.set_progress((self.client_context_id, {'context': self.client_context_id, 'batches': self.batch_count}))
+
+_FILTER_OPERATORS = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith '],
+]
+
+def _split_filter_part(filter_part):
+    # Our operator directly follows the (braced) name of our column, so it is never looked for within our value.
+    name_start, name_end = filter_part.find('{'), filter_part.find('}')
+    if name_start == -1 or name_end < name_start:
+        return None, None, None
+    name, operator_part = filter_part[name_start + 1: name_end], filter_part[name_end + 1:].lstrip()
+    for operator_type in _FILTER_OPERATORS:
+        for operator in operator_type:
+            if not operator_part.startswith(operator):
+                continue
+            value_part = operator_part[len(operator):].strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', '`'):
+                value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+            elif operator_type[0] in ('contains ', 'datestartswith '):
+                # Our string operators match the text of our value as it was typed.
+                value = value_part
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+            return name, operator_type[0].strip(), value
+    return None, None, None
+
+def _filter_frame(frame, filter_query):
+    for filter_part in filter_query.split(' && ') if filter_query else []:
+        column_name, operator, value = _split_filter_part(filter_part)
+        if column_name not in frame.columns:
+            continue
+        column = frame[column_name]
+        if operator == 'contains':
+            frame = frame.loc[column.astype(str).str.contains(str(value), regex=False)]
+        elif operator == 'datestartswith':
+            frame = frame.loc[column.astype(str).str.startswith(str(value))]
+        else:
+            if isinstance(value, float):
+                column = pandas.to_numeric(column, errors='coerce')
+            else:
+                column = column.astype(str)
+            frame = frame.loc[{
+                'ge': column.ge, 'le': column.le, 'lt': column.lt,
+                'gt': column.gt, 'ne': column.ne, 'eq': column.eq
+            }[operator](value)]
+    return frame
+
+def _sort_frame(frame, sort_by):
+    # Our table may still be sorted by a column of the results it showed before.
+    sort_by = [col for col in sort_by or [] if col['column_id'] in frame.columns]
+    if not sort_by:
+        return frame
+    sort_parameters = {
+        'by': [col['column_id'] for col in sort_by],
+        'ascending': [col['direction'] == 'asc' for col in sort_by],
+        'na_position': 'last',
+    }
+    try:
+        return frame.sort_values(**sort_parameters)
+    except TypeError:
+        # Our columns may hold values of mixed types, which we can only compare as strings.
+        return frame.sort_values(**sort_parameters, key=lambda column: column.astype(str))
+
+def _build_frame(query_results):
+    # Our results need to be flattened for use in a table.
+    frame = pandas.DataFrame([flatten_json.flatten(x) for x in query_results])
+    for column_name in frame.columns:
+        if frame[column_name].dtype == object:
+            is_nested = frame[column_name].map(lambda value: isinstance(value, (list, dict)))
+            frame[column_name] = frame[column_name].mask(is_nested, None)
+    return frame[sorted(frame.columns)]
+
+def _get_frame(handle):
+    frame = cache.get_frame(handle)
+    if frame is None:
+        frame = _build_frame(cache.get_results(handle))
+        if handle is not None:
+            cache.put_frame(handle, frame)
+    return frame
 
 @app.callback(
     dash.Output('tableViewer', 'data'),
     dash.Output('tableViewer', 'columns'),
+    dash.Output('tableViewer', 'page_count'),
+    dash.Output('tableViewer', 'page_current'),
+    dash.Output('tableHandle', 'data'),
     dash.Input('queryResults', 'data'),
-    dash.Input('outputTabs', 'active_tab')
+    dash.Input('outputTabs', 'active_tab'),
+    dash.Input('tableViewer', 'page_current'),
+    dash.Input('tableViewer', 'page_size'),
+    dash.Input('tableViewer', 'sort_by'),
+    dash.Input('tableViewer', 'filter_query'),
+    dash.State('tableHandle', 'data'),
 )
-def _update_table(query_results, active_tab):
+def _update_table(handle, active_tab, page_current, page_size, sort_by, filter_query, table_handle):
     if active_tab != 'tableOutputTab':
         raise dash.exceptions.PreventUpdate
 
-    # Our results need to be flattened for use in a table.
-    table_data = [flatten_json.flatten(x) for x in query_results]
-    column_names = set(k for kk in [x.keys() for x in table_data] for k in kk)
-    table_columns = [{"name": i, "id": i} for i in column_names]
-    table_columns.sort(key=get_name)
-    
-    for table_row in table_data:
-        del_list = []
-        for key, value in table_row.items():
-            if type(value) is list:
-                del_list.append(key)
-        for key in del_list:
-            del table_row[key]
-
-    return table_data, table_columns
+    # Switching back to our table does not require any work if it is already showing these results.
+    if ctx.triggered_id == 'outputTabs' and table_handle is not None and table_handle == handle:
+        raise dash.exceptions.PreventUpdate
+    if ctx.triggered_id == 'queryResults' or page_current is None:
+        page_current = 0
+
+    # Only the visible page of our (filtered and sorted) results is sent to the browser.
+    frame = _get_frame(handle)
+    table_columns = [{"name": i, "id": i} for i in frame.columns]
+    frame = _sort_frame(_filter_frame(frame, filter_query), sort_by)
+    page_count = max(math.ceil(len(frame) / page_size), 1)
+    page_current = min(page_current, page_count - 1)
+    page = frame.iloc[page_current * page_size: (page_current + 1) * page_size]
+    table_data = page.astype(object).where(page.notna(), None).to_dict('records')
+
+    return table_data, table_columns, page_count, page_current, handle
 
 @app.callback(
     dash.Output('net', 'data'),
+    dash.Output('net', 'run'),
     dash.Output('outputTabs', 'active_tab'),
+    dash.Output('drawnGraph', 'data'),
     dash.Input('graphData', 'data'),
-    dash.Input('outputTabs', 'active_tab')
+    dash.Input('outputTabs', 'active_tab'),
+    dash.Input('expandedClusters', 'data'),
+    dash.Input('server-layout', 'data'),
+    dash.State('drawnGraph', 'data'),
 )
-def _update_graph(graph_data, active_tab):
+def _update_graph(handle, active_tab, expanded_clusters, use_server_layout, drawn_handle):
     if active_tab != 'graphOutputTab':
         raise dash.exceptions.PreventUpdate
-    
+
+    # Our network may already hold this graph (see _expand_node).
+    if ctx.triggered_id == 'graphData' and handle is not None and handle == drawn_handle:
+        raise dash.exceptions.PreventUpdate
+
+    graph_data = cache.get_graph(handle)
     if not graph_data['nodes']:
         print('Cannot show data as graph, switch to Table Viewer tab...')
-        return graph_data, 'tableOutputTab'
-    
-    return graph_data, 'graphOutputTab'
+        return graph_data, dash.no_update, 'tableOutputTab', None
+
+    # Large graphs are drawn as super-nodes, which are expanded as they are selected.
+    expanded = expanded_clusters['expanded'] \
+        if expanded_clusters is not None and expanded_clusters['handle'] == handle else []
+    graph_data, view = _get_view(handle, graph_data, expanded)
+
+    # Our nodes can be placed by us (once per result and view), in which case vis.js does not need to simulate them.
+    # Otherwise, nodes that were placed by us for a previous graph are simulated again (vis.js deletes null options).
+    layout = _get_layout(handle, view, graph_data) if use_server_layout else None
+    if layout is not None:
+        graph_data['nodes'] = [
+            {**n, 'x': layout[n['id']][0], 'y': layout[n['id']][1], 'physics': False} for n in graph_data['nodes']
+        ]
+    else:
+        graph_data['nodes'] = [{**n, 'physics': None} for n in graph_data['nodes']]
+
+    is_lean = load_settings().get('graph', {}).get('lazy-details', False)
+    graph_data = {
+        'nodes': _get_view_elements(graph_data['nodes'], is_lean),
+        'edges': _get_view_elements(graph_data['edges'], is_lean),
+    }
+    return graph_data, f"{_TOOLTIP_SCRIPT}this.net.graphixHandle = {json.dumps(handle)};", 'graphOutputTab', handle
+
+def _get_view(handle, graph_data, expanded):
+    cluster_threshold = load_settings().get('graph', {}).get('cluster-threshold')
+    if cluster_threshold is None or len(graph_data['nodes']) <= cluster_threshold:
+        return graph_data, ()
+    communities = _get_communities(handle, len(graph_data['nodes']))
+    return graph.cluster_graph(graph_data, expanded, cluster_threshold, communities), \
+        tuple(sorted(expanded))
+
+def _get_layout(handle, view, graph_data):
+    # Our graph may have grown (see _expand_node) since we last placed it.
+    layout = cache.get_layout(handle, view)
+    if layout is not None and all(n['id'] in layout for n in graph_data['nodes']):
+        return layout
+
+    # Placing our nodes takes time quadratic in their number, so larger graphs are left to vis.js.
+    layout_node_limit = load_settings().get('graph', {}).get('layout-node-limit')
+    if layout_node_limit is not None and len(graph_data['nodes']) > layout_node_limit:
+        print(f'Cannot place {len(graph_data["nodes"])} nodes on the server, falling back to physics...')
+        return None
+    layout = graph.compute_layout(graph_data)
+    cache.put_layout(handle, view, layout)
+    return layout
+
+def _get_view_elements(elements, is_lean):
+    # Our network merges new elements into the ones it holds, and our ids restart with each query. Tooltips are set as
+    # elements are hovered over, so any tooltip left over from a previous graph is cleared (vis.js deletes options that
+    # are set to null). Our elements can also be sent without their documents, which are then fetched on demand.
+    if is_lean:
+        return [{'title': None, **{k: v for k, v in e.items() if k != 'data'}} for e in elements]
+    return [{'title': None, **e} for e in elements]
+
+@functools.lru_cache(maxsize=8)
+def _get_communities(handle, node_count):
+    # Our node count is part of our key, in case the graph behind our handle is not the one we last saw.
+    return graph.get_communities(cache.get_graph(handle))
+
+@app.callback(
+    dash.Output('expandedClusters', 'data'),
+    dash.Input('net', 'selection'),
+    dash.State('expandedClusters', 'data'),
+    dash.State('graphData', 'data'),
+    prevent_initial_call=True,
+)
+def _expand_cluster(selection, expanded_clusters, handle):
+    # Our super-nodes are the only nodes whose ids are not integers.
+    cluster_ids = [n for n in (selection or {}).get('nodes', []) if isinstance(n, str)]
+    if not cluster_ids:
+        raise dash.exceptions.PreventUpdate
+    expanded = expanded_clusters['expanded'] \
+        if expanded_clusters is not None and expanded_clusters['handle'] == handle else []
+    return {'handle': handle, 'expanded': expanded + [c for c in cluster_ids if c not in expanded]}
+
+@app.callback(
+    dash.Output('net', 'run', allow_duplicate=True),
+    dash.Output('graphData', 'data', allow_duplicate=True),
+    dash.Output('drawnGraph', 'data', allow_duplicate=True),
+    dash.Output('expandedClusters', 'data', allow_duplicate=True),
+    dash.Input('net', 'event1'),
+    dash.State('graphData', 'data'),
+    dash.State('node-limit', 'data'),
+    dash.State('server-layout', 'data'),
+    dash.State('expandedClusters', 'data'),
+    prevent_initial_call=True,
+)
+def _expand_node(event, handle, node_limit, use_server_layout, expanded_clusters):
+    if not event or not event.get('nodes') or handle is None:
+        raise dash.exceptions.PreventUpdate
+
+    # Our neighbor queries are built from the label and primary key of our vertex.
+    graph_data = cache.get_graph(handle)
+    node = next((n for n in graph_data['nodes'] if n['id'] == event['nodes'][0]), None)
+    if node is None:
+        raise dash.exceptions.PreventUpdate
+    graphs = get_metadata('Metadata', 'Graph')
+    vertex_keys = graph.get_vertex_keys(graphs)
+    row_limit = node_limit * load_settings()['query'].get('row-limit-factor', 2)
+    statements = graph.get_neighbor_statements(graphs, cache.get_graph_names(handle), vertex_keys, node['group'],
+                                               node['data'], row_limit)
+    if not statements:
+        print(f'Cannot expand a {node["group"]} vertex without a primary key (or outside of a managed graph)...')
+        raise dash.exceptions.PreventUpdate
+
+    # The neighbors of our vertex are merged into our graph, where they are identified just as our query did. Each
+    # expansion can add up to node-limit vertices.
+    node_count, edge_values = len(graph_data['nodes']), {e['id']: e.get('value') for e in graph_data['edges']}
+    is_aggregating = cache.is_aggregating(handle)
+    for statement in statements:
+        response = cluster.post_statement(statement).json()
+        if response['status'] != 'success':
+            raise GraphixStatementError(response)
+        if not response.get('results'):
+            continue
+        graph_builder = graph.GraphBuilder(response['graphix']['patterns'], node_count + node_limit, vertex_keys,
+                                           is_aggregating)
+        graph_builder.add_graph(graph_data)
+        for entry in response['results']:
+            if graph_builder.is_full:
+                break
+            graph_builder.add_entry(entry)
+        graph_data = graph_builder.to_dict()
+    changed_edges = [e for e in graph_data['edges'] if e['id'] not in edge_values or
+                     e.get('value') != edge_values[e['id']]]
+    if len(graph_data['nodes']) == node_count and not changed_edges:
+        raise dash.exceptions.PreventUpdate
+
+    # Our grown graph gets a handle of its own, as the graph of our query may also be served from our query cache.
+    expanded_handle = cache.put_expanded_graph(handle, graph_data)
+    if expanded_clusters is not None and expanded_clusters['handle'] == handle:
+        expanded_clusters = {'handle': expanded_handle, 'expanded': expanded_clusters['expanded']}
+    else:
+        expanded_clusters = dash.no_update
+
+    # Graphs that are clustered or placed by us are drawn again, otherwise only our new elements are sent.
+    cluster_threshold = load_settings().get('graph', {}).get('cluster-threshold')
+    if use_server_layout or (cluster_threshold is not None and len(graph_data['nodes']) > cluster_threshold):
+        return dash.no_update, expanded_handle, dash.no_update, expanded_clusters
+    new_nodes = [n for n in graph_data['nodes'] if n['id'] > node_count]
+    is_lean = load_settings().get('graph', {}).get('lazy-details', False)
+    new_nodes, changed_edges = _get_view_elements(new_nodes, is_lean), _get_view_elements(changed_edges, is_lean)
+    script = f"this.nn.update({json.dumps(new_nodes)});\nthis.ee.update({json.dumps(changed_edges)});\n" \
+             f"this.net.graphixHandle = {json.dumps(expanded_handle)};"
+    return script, expanded_handle, expanded_handle, expanded_clusters
+
+@app.callback(
+    dash.Output('net', 'run', allow_duplicate=True),
+    dash.Output('renderedBatches', 'data'),
+    dash.Input('queryProgress', 'data'),
+    dash.State('renderedBatches', 'data'),
+    prevent_initial_call=True,
+)
+def _render_progress(progress, rendered):
+    # A query that has already completed (or was cancelled) is drawn by _update_graph instead.
+    if not progress or not cache.is_request_running(progress['context']):
+        raise dash.exceptions.PreventUpdate
+
+    # Batches are added to our network as they are published. A new query starts from an empty network.
+    is_new_query = rendered is None or rendered['context'] != progress['context']
+    start = 0 if is_new_query else rendered['batches']
+    if not is_new_query and start >= progress['batches']:
+        raise dash.exceptions.PreventUpdate
+    script = [_TOOLTIP_SCRIPT, 'this.net.graphixStreaming = true;']
+    if is_new_query:
+        script.append('this.nn.clear(); this.ee.clear();')
+    for batch in cache.get_batches(progress['context'], start, progress['batches']):
+        script.append(f"this.nn.update({json.dumps(batch['nodes'])});")
+        script.append(f"this.ee.update({json.dumps(batch['edges'])});")
+    return '\n'.join(script), progress
+
+@app.callback(
+    dash.Output('net', 'run', allow_duplicate=True),
+    dash.Input('net', 'event0'),
+    dash.Input('net', 'selection'),
+    dash.State('graphData', 'data'),
+    prevent_initial_call=True,
+)
+def _describe_element(hovered, selected, handle):
+    element = hovered if 'net.event0' in ctx.triggered_prop_ids else selected
+    if not element or not (element.get('nodes') or element.get('edges')):
+        raise dash.exceptions.PreventUpdate
+
+    # Only the single document we need is read from our result store.
+    kind, dataset = ('nodes', 'this.nn') if element.get('nodes') else ('edges', 'this.ee')
+    element_id = element[kind][0]
+    if not isinstance(element_id, int):
+        raise dash.exceptions.PreventUpdate
+    title_json = json.dumps(cache.get_element(handle, kind, element_id), indent=2)
+    title = f"<pre><code>{title_json}</code></pre>"
+
+    # Our network may have drawn another graph (with the same ids) since this element was hovered over.
+    return f"if (this.net.graphixHandle === {json.dumps(handle)}) " \
+           f"{dataset}.update({{id: {json.dumps(element_id)}, title: {json.dumps(title)}}});"
 
 @app.callback(
     dash.Output('queryInput', 'theme'),
@@ -254,6 +739,8 @@ def _update_theme(is_light):
     return query_input_theme, style_header, style_data, style_data_conditional
 
 
+# Our query page is filled in by callbacks, so the layout itself (and the keywords it highlights) is only built once.
+@functools.cache
 def build_page():
     def _build_input_pane():
         return bootstrap.Card(
@@ -270,8 +757,8 @@ def build_page():
                             showPrintMargin=False,
                             maxLines=math.inf,
                             syntaxKeywords={
-                                'support.function': '|'.join(x for x in utilities.scrape_functions().keys()),
-                                'keyword.other': '|'.join(x for x in utilities.scrape_keywords()),
+                                'support.function': '|'.join(utilities.get_function_names()),
+                                'keyword.other': '|'.join(utilities.get_keywords()),
                                 'constant.language': 'true|false'
                             },
                             className='h-100 w-100'
@@ -279,6 +766,28 @@ def build_page():
                         html.Div(
                             className='position-relative',
                             children=[
+                                html.Div(
+                                    id='cacheIndicator',
+                                    className='position-absolute bottom-0 start-0',
+                                    style={'display': 'none'},
+                                    children=[
+                                        bootstrap.Badge("Served from cache", color='info', className='me-2'),
+                                        html.Button(
+                                            id='rerunButton',
+                                            className='btn btn-outline-secondary btn-sm',
+                                            children=[
+                                                html.Span(className="bi bi-arrow-repeat"),
+                                                " Re-run "
+                                            ],
+                                            type='button',
+                                            n_clicks=0
+                                        ),
+                                    ]
+                                ),
+                                html.Div(
+                                    className='position-absolute bottom-0 fetchAllSwitch',
+                                    children=bootstrap.Switch(id='fetchAllSwitch', label="Fetch all rows", value=False)
+                                ),
                                 html.Button(
                                     id='runButton',
                                     className='btn btn-primary position-absolute bottom-0 end-0 queryButton',
@@ -310,6 +819,10 @@ def build_page():
                                 bootstrap.Tab(
                                     tab_id='graphOutputTab',
                                     children=[
+                                        dash.dcc.Store(id='renderedBatches', data=None),
+                                        dash.dcc.Store(id='expandedClusters', data=None),
+                                        dash.dcc.Store(id='graphStyles', data={}),
+                                        dash.dcc.Store(id='drawnGraph', data=None),
                                         visdcc.Network(
                                             id='net',
                                             data={
@@ -335,9 +848,18 @@ def build_page():
                                         html.Div(
                                             dash.dash_table.DataTable(
                                                 id='tableViewer',
+                                                page_action='custom',
+                                                page_current=0,
+                                                page_size=_TABLE_PAGE_SIZE,
+                                                sort_action='custom',
+                                                sort_mode='multi',
+                                                sort_by=[],
+                                                filter_action='custom',
+                                                filter_query='',
                                             ),
                                             id='tableDiv'
-                                        )
+                                        ),
+                                        dash.dcc.Store(id='tableHandle', data=None),
                                     ],
                                     label="Table Viewer",
                                 )
@@ -346,7 +868,19 @@ def build_page():
                         html.Div(
                             id='outputPaneSpinner',
                             className='position-absolute top-50 start-50 translate-middle',
-                        )
+                        ),
+                        html.Button(
+                            id='cancelButton',
+                            className='btn btn-outline-danger btn-sm position-absolute top-50 start-50 '
+                                      'translate-middle cancelButton',
+                            style={'display': 'none'},
+                            children=[
+                                html.Span(className="bi bi-stop"),
+                                " Cancel "
+                            ],
+                            type='button',
+                            n_clicks=0
+                        ),
                     ]
                 )
             ]
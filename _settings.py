@@ -1,3 +1,4 @@
+import functools
 import dash
 from dash import html, ctx
 import dash_daq as daq
@@ -5,13 +6,17 @@ import dash_bootstrap_components as bootstrap
 from __errors__ import *
 from __global__ import *
 
+_COLOR_DEBOUNCE_MS = 250
 
+
+# Our list is only built when our page is opened, changes to a color after this only touch its own swatch.
 @app.callback(
     dash.Output('color-map', 'children'),
-    dash.Input('graphSettings', 'data')
+    dash.Input('url', 'pathname'),
+    dash.State('graphSettings', 'data'),
 )
-def _color_setting(settings):
-    if settings is None:
+def _color_setting(pathname, settings):
+    if pathname != SETTINGS_DIRECTORY or settings is None or 'groups' not in settings:
         raise dash.exceptions.PreventUpdate
     else:
         return bootstrap.ListGroup(
@@ -19,13 +24,16 @@ def _color_setting(settings):
                 bootstrap.ListGroupItem(
                     [
                         html.Div(k, style={'float': 'left'}),
-                        html.Div(style={
-                            'height': 16,
-                            'width': 20,
-                            'float': 'right',
-                            'margin': 4,
-                            'background': v['color']['background']
-                        }),
+                        html.Div(
+                            id={'group-color': k},
+                            style={
+                                'height': 16,
+                                'width': 20,
+                                'float': 'right',
+                                'margin': 4,
+                                'background': v['color']['background']
+                            }
+                        ),
                     ],
                     id={'group-name': k}
                 )
@@ -54,18 +62,50 @@ def _select_group(n_clicks, choice, settings):
     color = settings['groups'][new_choice]['color']['background']
     return new_choice, {'display': 'block'}, 'Color Picker: ' + new_choice, {'hex': color}
 
-@app.callback(
-    dash.Output('graphSettings', 'data', allow_duplicate=True),
+# Our color picker changes its value with every step of a drag, so only the color it settles on is sent to the server.
+app.clientside_callback(
+    """
+    function (color, group) {
+        var token = {};
+        window.graphixColorToken = token;
+        return new Promise(function (resolve) {
+            setTimeout(function () {
+                var choice = {group: group, color: color};
+                resolve(window.graphixColorToken === token ? choice : window.dash_clientside.no_update);
+            }, %d);
+        });
+    }
+    """ % _COLOR_DEBOUNCE_MS,
+    dash.Output('color-choice', 'data'),
     dash.Input('color-picker', 'value'),
     dash.State('group-choice', 'data'),
-    dash.State('graphSettings', 'data'),
     prevent_initial_call=True,
 )
-def _change_color(color, group, settings):
-    if group is None:
+
+@app.callback(
+    dash.Output('graphSettings', 'data', allow_duplicate=True),
+    dash.Output({'group-color': dash.ALL}, 'style'),
+    dash.Input('color-choice', 'data'),
+    dash.State({'group-color': dash.ALL}, 'id'),
+    prevent_initial_call=True,
+)
+def _change_color(choice, swatch_ids):
+    if choice is None or choice['group'] is None:
         raise dash.exceptions.PreventUpdate
-    settings['groups'][group]['color']['background'] = color['hex']
-    return settings
+    group, color = choice['group'], choice['color']
+
+    # Only the color of our group is sent back, rather than all of our settings (and every swatch in our list).
+    settings_patch = dash.Patch()
+    settings_patch['groups'][group]['color']['background'] = color['hex']
+    swatch_styles = []
+    for swatch_id in swatch_ids:
+        if swatch_id['group-color'] == group:
+            swatch_style = dash.Patch()
+            swatch_style['background'] = color['hex']
+            swatch_styles.append(swatch_style)
+        else:
+            swatch_styles.append(dash.no_update)
+    return settings_patch, swatch_styles
 
 @app.callback(
     dash.Output('node-limit-input', 'value'),
@@ -84,10 +124,66 @@ def _init_settings(pathname, node_limit):
 def _init_settings(node_limit):
     return node_limit
 
+@app.callback(
+    dash.Output('query-cache-input', 'value'),
+    dash.Input('url', 'pathname'),
+    dash.State('query-cache', 'data'),
+)
+def _init_query_cache(pathname, use_query_cache):
+    if pathname != SETTINGS_DIRECTORY:
+        raise dash.exceptions.PreventUpdate
+    return use_query_cache
+
+@app.callback(
+    dash.Output('query-cache', 'data'),
+    dash.Input('query-cache-input', 'value'),
+    prevent_initial_call=True,
+)
+def _set_query_cache(use_query_cache):
+    return use_query_cache
+
+@app.callback(
+    dash.Output('edge-aggregation-input', 'value'),
+    dash.Input('url', 'pathname'),
+    dash.State('edge-aggregation', 'data'),
+)
+def _init_edge_aggregation(pathname, is_aggregating):
+    if pathname != SETTINGS_DIRECTORY:
+        raise dash.exceptions.PreventUpdate
+    return is_aggregating
+
+@app.callback(
+    dash.Output('edge-aggregation', 'data'),
+    dash.Input('edge-aggregation-input', 'value'),
+    prevent_initial_call=True,
+)
+def _set_edge_aggregation(is_aggregating):
+    return is_aggregating
+
+@app.callback(
+    dash.Output('server-layout-input', 'value'),
+    dash.Input('url', 'pathname'),
+    dash.State('server-layout', 'data'),
+)
+def _init_server_layout(pathname, use_server_layout):
+    if pathname != SETTINGS_DIRECTORY:
+        raise dash.exceptions.PreventUpdate
+    return use_server_layout
+
+@app.callback(
+    dash.Output('server-layout', 'data'),
+    dash.Input('server-layout-input', 'value'),
+    prevent_initial_call=True,
+)
+def _set_server_layout(use_server_layout):
+    return use_server_layout
 
+
+@functools.cache
 def build_page():
     return bootstrap.Container(
         [
+            dash.dcc.Store(id='color-choice', data=None),
             html.H4('Customize Nodes Color', style={'margin-top': 10, 'margin-bottom': 10}),
             bootstrap.Row(
                 [
@@ -115,5 +211,44 @@ def build_page():
                 ],
                 style={'margin-top': 30, 'margin-bottom': 10}
             ),
+            bootstrap.Row(
+                [
+                    bootstrap.Col(
+                        html.H4('Query Result Cache'),
+                        width=4
+                    ),
+                    bootstrap.Col(
+                        bootstrap.Switch(id="query-cache-input", label="Serve repeated read-only queries from cache"),
+                        width=6
+                    )
+                ],
+                style={'margin-top': 30, 'margin-bottom': 10}
+            ),
+            bootstrap.Row(
+                [
+                    bootstrap.Col(
+                        html.H4('Parallel Edges'),
+                        width=4
+                    ),
+                    bootstrap.Col(
+                        bootstrap.Switch(id="edge-aggregation-input", label="Collapse parallel edges into one weighted edge"),
+                        width=6
+                    )
+                ],
+                style={'margin-top': 30, 'margin-bottom': 10}
+            ),
+            bootstrap.Row(
+                [
+                    bootstrap.Col(
+                        html.H4('Graph Layout'),
+                        width=4
+                    ),
+                    bootstrap.Col(
+                        bootstrap.Switch(id="server-layout-input", label="Place nodes on the server (no physics)"),
+                        width=6
+                    )
+                ],
+                style={'margin-top': 30, 'margin-bottom': 10}
+            ),
         ]
     )
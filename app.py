@@ -7,14 +7,21 @@ import _query as query_page
 import _functions as functions_page
 import _metadata as metadata_page
 import _settings as settings_page
+import __jobs__ as jobs
+import __utilities__ as utilities
 
 app.layout = html.Div(
     children=[
         dash.dcc.Location(id="url"),
-        dash.dcc.Store(id='queryResults', data={}),
-        dash.dcc.Store(id='graphData', data={'nodes': [], 'edges': []}),
+        dash.dcc.Store(id='queryResults', data=None),
+        dash.dcc.Store(id='graphData', data=None),
+        dash.dcc.Store(id='queryContext', data=None),
+        dash.dcc.Store(id='queryProgress', data=None),
         dash.dcc.Store(id='group-choice', data=None),
         dash.dcc.Store(id='node-limit', storage_type='local', data=100),
+        dash.dcc.Store(id='query-cache', storage_type='local', data=False),
+        dash.dcc.Store(id='edge-aggregation', storage_type='local', data=False),
+        dash.dcc.Store(id='server-layout', storage_type='local', data=False),
         dash.dcc.Store(id='graphSettings', storage_type='local', data={
             'autoResize': True,
             'height': '600px',
@@ -110,6 +117,15 @@ app.layout = html.Div(
     ]
 )
 
+# Our function and keyword catalogs are loaded before we serve any requests.
+utilities.load_catalogs()
+
+# Our WSGI entry point, i.e. `gunicorn app:server`.
+server = app.server
+
+# Our Celery workers (if we are using them) are started against this app, so that they know of our callbacks.
+celery_app = jobs.celery_app
+
 # Define our callback for our page content.
 @app.callback(
     dash.Output("page-content", "children"),
@@ -128,4 +144,12 @@ def render_page_content(pathname):
         pass
 
 if __name__ == '__main__':
-    app.run_server(debug=True, dev_tools_hot_reload=False)
+    # This is Flask's development server, use gunicorn (or waitress) to serve more than a handful of users.
+    server_settings = load_settings().get('server', {})
+    app.run_server(
+        host=server_settings.get('host', '127.0.0.1'),
+        port=server_settings.get('port', 8050),
+        debug=server_settings.get('debug', False),
+        dev_tools_hot_reload=False,
+        threaded=True,
+    )
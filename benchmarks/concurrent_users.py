@@ -0,0 +1,49 @@
+""" Measure the latency and throughput of a running visualizer as seen by a number of concurrent users. """
+import argparse
+import concurrent.futures
+import statistics
+import time
+import requests
+
+# Each of our users loads our page layout and then runs the callback that colors our graph by vertex label.
+LABELS_CALLBACK = {
+    'output': 'graphSettings.data',
+    'outputs': {'id': 'graphSettings', 'property': 'data'},
+    'inputs': [{'id': 'url', 'property': 'pathname', 'value': '/'}],
+    'state': [{'id': 'graphSettings', 'property': 'data', 'value': {}}],
+    'changedPropIds': ['url.pathname'],
+}
+
+
+def run_user(base_url, request_count):
+    latencies, response_bytes = [], 0
+    with requests.Session() as session:
+        for _ in range(request_count):
+            start = time.perf_counter()
+            layout_response = session.get(f'{base_url}/_dash-layout')
+            callback_response = session.post(f'{base_url}/_dash-update-component', json=LABELS_CALLBACK)
+            latencies.append(time.perf_counter() - start)
+            for response in (layout_response, callback_response):
+                response.raise_for_status()
+                response_bytes += int(response.headers.get('Content-Length', len(response.content)))
+    return latencies, response_bytes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8050')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=20)
+    arguments = parser.parse_args()
+
+    print(f"{'users':>6} {'page loads/s':>13} {'p50 (ms)':>9} {'p95 (ms)':>9} {'bytes/load':>11}")
+    for user_count in arguments.users:
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=user_count) as executor:
+            user_results = list(executor.map(run_user, [arguments.url] * user_count,
+                                             [arguments.requests] * user_count))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(x for user_latencies, _ in user_results for x in user_latencies)
+        load_bytes = sum(b for _, b in user_results) // len(latencies)
+        print(f"{user_count:>6} {len(latencies) / elapsed:>13.1f} {statistics.median(latencies) * 1000:>9.1f} "
+              f"{latencies[int(len(latencies) * 0.95)] * 1000:>9.1f} {load_bytes:>11}")
@@ -0,0 +1,14 @@
+""" Gunicorn reads this file on startup, i.e. `gunicorn app:server` serves our app with the settings below. """
+import pathlib
+import json
+
+with (pathlib.Path(__file__).parent / 'settings/graphix.json').open('r') as fp:
+    _server_settings = json.load(fp).get('server', {})
+
+bind = f"{_server_settings.get('host', '127.0.0.1')}:{_server_settings.get('port', 8050)}"
+workers = _server_settings.get('workers', 4)
+threads = _server_settings.get('threads', 8)
+worker_class = 'gthread'
+
+# Our queries run as background jobs, so a request only outlives this timeout if something has gone wrong.
+timeout = _server_settings.get('timeout', 120)
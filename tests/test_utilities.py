@@ -0,0 +1,62 @@
+""" Tests for the SQL++ statement helpers used when submitting queries. """
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+import __utilities__ as utilities
+
+
+def test_split_statements_drops_comments():
+    statements = "USE Gelp; -- our dataverse\nSELECT VALUE ';' /* not a terminator */ FROM R r;"
+    assert utilities.split_statements(statements) == ['USE Gelp', "SELECT VALUE ';'   FROM R r"]
+
+def test_limit_keeps_optimizer_hints():
+    statements = "SELECT * FROM R r, B b WHERE r.stars /*+ indexnl */ = b.stars;"
+    assert utilities.limit_statements(statements, 10) == \
+        "SELECT * FROM R r, B b WHERE r.stars /*+ indexnl */ = b.stars\nLIMIT 10;"
+
+def test_limit_goes_before_trailing_comments():
+    assert utilities.limit_statements("SELECT VALUE r FROM R r -- every review", 10) == \
+        "SELECT VALUE r FROM R r\nLIMIT 10 -- every review"
+    assert utilities.limit_statements("SELECT VALUE r FROM R r; /* done */\n", 10) == \
+        "SELECT VALUE r FROM R r\nLIMIT 10; /* done */\n"
+
+def test_limit_only_applies_to_last_statement():
+    statements = "USE Gelp;\nFROM GRAPH GelpGraph (r:Review) SELECT r;"
+    assert utilities.limit_statements(statements, 10) == \
+        "USE Gelp;\nFROM GRAPH GelpGraph (r:Review) SELECT r\nLIMIT 10;"
+
+def test_limit_in_subquery_is_not_top_level():
+    statements = "SELECT VALUE (SELECT VALUE b FROM B b LIMIT 1) FROM R r;"
+    assert utilities.limit_statements(statements, 10) == \
+        "SELECT VALUE (SELECT VALUE b FROM B b LIMIT 1) FROM R r\nLIMIT 10;"
+
+def test_limit_is_not_added_twice():
+    statements = "SELECT VALUE r FROM R r LIMIT 5;"
+    assert utilities.limit_statements(statements, 10) == statements
+    statements = "SELECT VALUE 'LIMIT 5' FROM R r;"
+    assert utilities.limit_statements(statements, 10) == "SELECT VALUE 'LIMIT 5' FROM R r\nLIMIT 10;"
+
+def test_limit_goes_before_top_level_offset():
+    statements = "SELECT VALUE r FROM R r ORDER BY r.id OFFSET 5;"
+    assert utilities.limit_statements(statements, 10) == "SELECT VALUE r FROM R r ORDER BY r.id LIMIT 10 OFFSET 5;"
+    statements = "SELECT VALUE (SELECT VALUE b FROM B b OFFSET 1) FROM R r -- no OFFSET here"
+    assert utilities.limit_statements(statements, 10) == \
+        "SELECT VALUE (SELECT VALUE b FROM B b OFFSET 1) FROM R r\nLIMIT 10 -- no OFFSET here"
+
+def test_limit_applies_to_union():
+    statements = "SELECT VALUE 1 UNION ALL SELECT VALUE 2;"
+    assert utilities.limit_statements(statements, 10) == "SELECT VALUE 1 UNION ALL SELECT VALUE 2\nLIMIT 10;"
+
+def test_limit_skips_non_queries():
+    for statements in ("CREATE DATASET R(RType) PRIMARY KEY id;", "INSERT INTO R ({'id': 1});", "", "-- nothing"):
+        assert utilities.limit_statements(statements, 10) == statements
+
+def test_graph_names_follow_use_statements():
+    statements = "USE Gelp;\nFROM GRAPH GelpGraph (r:Review) SELECT r;\nFROM GRAPH `Other`.`G` (a) SELECT a;"
+    assert utilities.get_graph_names(statements) == [('Gelp', 'GelpGraph'), ('Other', 'G')]
+    assert utilities.get_graph_names("FROM GRAPH G (a) SELECT a;") == [('Default', 'G')]
+
+def test_graph_names_skip_anonymous_graphs():
+    statements = "FROM GRAPH VERTEX (:Review) PRIMARY KEY (id) AS Reviews (r:Review) SELECT r;"
+    assert utilities.get_graph_names(statements) == []